@@ -6,11 +6,11 @@ from typing import List, Tuple
 from langchain_core.messages import HumanMessage
 import os
 from langchain_aws import ChatBedrock
-from elasticsearch import Elasticsearch
+from search_clients import get_elastic_client
 import random
 
 ELASTIC_HOST = "http://localhost:9200"
-es = Elasticsearch(ELASTIC_HOST)
+es = get_elastic_client(ELASTIC_HOST)
 
 
 
@@ -1,10 +1,33 @@
+import os
 from typing import List, Callable
-from elasticsearch import Elasticsearch
+from search_clients import get_elastic_client
 import json
 import tiktoken
 
 ELASTIC_HOST = "http://localhost:9200"
-es = Elasticsearch(ELASTIC_HOST)
+es = get_elastic_client(ELASTIC_HOST)
+# Per-collection document records written at ingest (total_pages, file_hash, ...)
+DOCUMENT_METADATA_INDEX = os.getenv("DOCUMENT_METADATA_INDEX", "document-metadata")
+
+
+def get_total_pages(index_name: str, meta: dict):
+    """
+    Page count from the collection's document record; older indices carry it
+    on every page, and without either it is the highest indexed page number.
+    """
+    try:
+        record = es.get(index=DOCUMENT_METADATA_INDEX, id=index_name.lower())["_source"]
+    except Exception:
+        record = {}
+    total_pages = record.get("total_pages", meta.get("total_pages"))
+    if total_pages is None:
+        response = es.search(
+            index=index_name,
+            size=0,
+            aggs={"last_page": {"max": {"field": "metadata.page"}}},
+        )
+        total_pages = int(response["aggregations"]["last_page"]["value"] or 0)
+    return total_pages
 
 
 def search_and_expand_with_neighbors_elastic(
@@ -27,7 +50,7 @@ def search_and_expand_with_neighbors_elastic(
                 state["error_message"] = f"No data found in index: {index_name}"
                 return state
             meta = hits[0]["_source"].get("metadata", {})
-            total_pages = meta.get("total_pages")
+            total_pages = get_total_pages(index_name, meta)
             if state["total_pages"] == -1:
                 if total_pages == 0:
                     state["error"] = True
@@ -1,5 +1,5 @@
 from typing import List, Callable
-import chromadb
+from search_clients import get_chroma_client
 import json
 
 def search_and_expand_with_neighbors(
@@ -29,7 +29,7 @@ def search_and_expand_with_neighbors(
     """
 
     # 1. Connect to Chroma
-    db = chromadb.HttpClient(host=chroma_host, port=8000)
+    db = get_chroma_client(chroma_host, 8000)
     collection = db.get_or_create_collection(collection_name)
 
     # 2. Perform keyword search using query_texts
@@ -4,10 +4,10 @@ import random
 import json
 from typing import List, Dict
 import requests
-from elasticsearch import Elasticsearch
+from search_clients import get_elastic_client
 
 ELASTIC_HOST = "http://localhost:9200"
-es = Elasticsearch(ELASTIC_HOST)
+es = get_elastic_client(ELASTIC_HOST)
 
 
 class Struture(BaseModel):
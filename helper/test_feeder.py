@@ -1,5 +1,5 @@
 from typing import List, Callable
-import chromadb
+from search_clients import get_chroma_client
 
 def generate_feeder_from_page_range(
     chroma_host: str,
@@ -26,7 +26,7 @@ def generate_feeder_from_page_range(
         List[str]: List of feeder text chunks
     """
     # 1. Connect to ChromaDB
-    db = chromadb.HttpClient(host=chroma_host, port=8000)
+    db = get_chroma_client(chroma_host, 8000)
     collection = db.get_or_create_collection(collection_name)
 
     # 2. Fetch pages in the requested range
@@ -2,7 +2,7 @@
 from pathlib import Path
 from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Request
 from fastapi.responses import JSONResponse
-from typing import List
+from typing import List, Optional
 import hashlib
 from io import BytesIO
 import json
@@ -18,7 +18,6 @@ from typing import List
 import hashlib
 from io import BytesIO
 import json
-import aiofiles
 from uuid import uuid4
 import os
 from pydantic import BaseModel
@@ -27,6 +26,17 @@ from pydantic import BaseModel
 from app.api.utils.cache import delete_stop_flag
 import boto3
 from app.api.utils.cache import delete_stream, delete_stop_flag,set_task_ids
+from app.api.utils.cache import get_ingested_collection, publish_stream_event
+from app.api.utils.cache import (
+    MAX_UPLOAD_CHUNKS,
+    delete_upload_state,
+    get_missing_chunks,
+    get_upload_digest,
+    is_upload_assembled,
+    mark_chunk_received,
+    set_upload_digest,
+)
+import shutil
 
 collections_router = APIRouter()
 
@@ -80,6 +90,10 @@ UPLOAD_DIRECTORY = Path("../data/raw")
 UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
 CHUNK_SIZE = 1024 * 1024 * 5  # 5MB per chunk
 MAX_FILE_SIZE_BYTES = 100 * 1024 * 1024  # 100MB max file size
+# total_chunks is capped by the chunk bitmap kept in Redis, which sets the
+# smallest chunk_size a multi-chunk upload of the largest file may declare.
+MAX_TOTAL_CHUNKS = MAX_UPLOAD_CHUNKS
+MIN_CHUNK_SIZE = -(-MAX_FILE_SIZE_BYTES // MAX_TOTAL_CHUNKS)
 
 
 
@@ -93,6 +107,88 @@ class ProcessFileRequest(BaseModel):
 
 
 
+def upload_layout_error(
+    chunk_index: int, total_chunks: int, chunk_size: int, file_size: Optional[int]
+) -> Optional[str]:
+    """
+    Check the client-supplied layout of a chunked upload against the size
+    limits before anything is written; returns the problem, or None.
+    """
+    if not 0 < total_chunks <= MAX_TOTAL_CHUNKS:
+        return f"total_chunks must be between 1 and {MAX_TOTAL_CHUNKS}."
+    if not 0 <= chunk_index < total_chunks:
+        return f"Chunk index {chunk_index} out of range for {total_chunks} chunks."
+    if not 0 < chunk_size <= CHUNK_SIZE or (
+        total_chunks > 1 and chunk_size < MIN_CHUNK_SIZE
+    ):
+        return f"chunk_size must be between {MIN_CHUNK_SIZE} and {CHUNK_SIZE} bytes."
+    # The last chunk must start inside the size limit.
+    if (total_chunks - 1) * chunk_size >= MAX_FILE_SIZE_BYTES:
+        return f"File exceeds the {MAX_FILE_SIZE_BYTES // (1024 * 1024)}MB limit."
+    if file_size is not None:
+        if not 0 < file_size <= MAX_FILE_SIZE_BYTES:
+            return f"File exceeds the {MAX_FILE_SIZE_BYTES // (1024 * 1024)}MB limit."
+        if total_chunks != -(-file_size // chunk_size):
+            return f"{total_chunks} chunks of {chunk_size} bytes do not make a {file_size}-byte file."
+    return None
+
+
+def write_chunk_at_offset(
+    path: Path, offset: int, data: bytes, file_size: int = None
+):
+    """Write ``data`` at ``offset`` of ``path`` (positional write, no re-copy)."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if file_size and os.fstat(fd).st_size < file_size:
+            os.ftruncate(fd, file_size)  # preallocate once the size is known
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+    finally:
+        os.close(fd)
+
+
+def file_sha256(path: Path, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def attach_existing_collection(
+    chat_id: str, file_id: str, chat_folder: Path, collection_name: str
+) -> JSONResponse:
+    """Point a chat at an already-indexed collection and report it as done."""
+    print(f"[DEBUG] Duplicate upload for chat {chat_id}, reusing {collection_name}")
+    publish_stream_event(
+        chat_id,
+        {
+            "message": "File already indexed; reusing existing collection.",
+            "type": "task_complete",
+            "chat_id": chat_id,
+            "collections": [collection_name],
+            "isFinished": True,
+        },
+    )
+    shutil.rmtree(chat_folder, ignore_errors=True)
+
+    return JSONResponse(
+        content={
+            "success": True,
+            "message": "File already processed.",
+            "chat_id": chat_id,
+            "file_id": file_id,
+            "collections": [collection_name],
+            "deduplicated": True,
+            "progress": "100%",
+        },
+        status_code=200,
+    )
+
+
 @collections_router.post("/upload")
 async def upload_chunk(
     file: UploadFile = File(...),
@@ -100,17 +196,32 @@ async def upload_chunk(
     file_id: str = Form(None),
     chunk_index: int = Form(...),
     total_chunks: int = Form(...),
+    chunk_size: int = Form(CHUNK_SIZE),
+    file_size: int = Form(None),
+    chunk_sha256: str = Form(None),
+    # Client's digest of the whole file; named so it does not shadow file_sha256().
+    expected_file_sha256: str = Form(None, alias="file_sha256"),
 ):
     
 
     file_id = file_id or str(uuid4())
 
+    layout_error = upload_layout_error(chunk_index, total_chunks, chunk_size, file_size)
+    if layout_error:
+        return JSONResponse(
+            content={"success": False, "message": layout_error},
+            status_code=400,
+        )
+
     delete_stop_flag(chat_id)
     delete_stream(chat_id)
     
-    chunks_dir = UPLOAD_DIRECTORY / chat_id / f"{file_id}_chunks"
-    chunks_dir.mkdir(parents=True, exist_ok=True)
-    chunk_file_path = chunks_dir / f"chunk_{chunk_index:05d}.part"
+    chat_folder = UPLOAD_DIRECTORY / chat_id
+    chat_folder.mkdir(parents=True, exist_ok=True)
+    # Chunks land directly at their offset in this file; it is renamed once complete.
+    partial_file_path = chat_folder / f".{file_id}.partial"
+    # Set once this request holds the assembly claim; released on any failure.
+    claimed = False
 
     try:
         chunk = await file.read()
@@ -124,32 +235,56 @@ async def upload_chunk(
                 status_code=400,
             )
 
-        async with aiofiles.open(chunk_file_path, "wb") as chunk_file:
-            await chunk_file.write(chunk)
+        if chunk_sha256 and hashlib.sha256(chunk).hexdigest() != chunk_sha256.lower():
+            return JSONResponse(
+                content={
+                    "success": False,
+                    "message": f"Checksum mismatch for chunk {chunk_index}; please resend it.",
+                    "chunk_index": chunk_index,
+                },
+                status_code=400,
+            )
+
+        if expected_file_sha256:
+            set_upload_digest(file_id, expected_file_sha256)
+
+        is_last_chunk = chunk_index == total_chunks - 1
+        chunk_end = chunk_index * chunk_size + len(chunk)
+        if (
+            len(chunk) > chunk_size
+            or (not is_last_chunk and len(chunk) != chunk_size)
+            or chunk_end > (file_size or MAX_FILE_SIZE_BYTES)
+        ):
+            return JSONResponse(
+                content={
+                    "success": False,
+                    "message": f"Chunk {chunk_index} must be {chunk_size} bytes (last chunk at most).",
+                },
+                status_code=400,
+            )
+
+        await asyncio.to_thread(
+            write_chunk_at_offset,
+            partial_file_path,
+            chunk_index * chunk_size,
+            chunk,
+            file_size,
+        )
 
         progress = ((chunk_index + 1) / total_chunks) * 100
         print(f"✅ Chunk {chunk_index + 1}/{total_chunks} uploaded ({progress:.2f}%)")
 
-        # Final chunk: assemble and upload
-        all_chunks_present = all(
-            (chunks_dir / f"chunk_{i:05d}.part").exists() for i in range(total_chunks)
-        )
+        # Final chunk: whichever request completes the set assembles the file
+        all_chunks_present = mark_chunk_received(file_id, chunk_index, total_chunks)
 
         if all_chunks_present:
-            chat_folder = UPLOAD_DIRECTORY / chat_id
-            chat_folder.mkdir(parents=True, exist_ok=True)
-
+            claimed = True
             final_file_path = chat_folder / file.filename
 
-            # 🔍 Assemble file
+            # 🔍 Every chunk is already in place: just rename and fingerprint
             try:
-                with open(final_file_path, "wb") as final_file:
-                    for i in range(total_chunks):
-                        part_path = chunks_dir / f"chunk_{i:05d}.part"
-                        if not part_path.exists():
-                            raise FileNotFoundError(f"Missing chunk part: {part_path}")
-                        with open(part_path, "rb") as part_file:
-                            final_file.write(part_file.read())
+                os.replace(partial_file_path, final_file_path)
+                fingerprint = await asyncio.to_thread(file_sha256, final_file_path)
                 print(f"[DEBUG] Final file assembled at {final_file_path}")
             except Exception as e:
                 print(f"❌ Assembly error: {e}")
@@ -158,11 +293,33 @@ async def upload_chunk(
                     status_code=500,
                 )
 
+            expected_digest = get_upload_digest(file_id)
+            if expected_digest and expected_digest != fingerprint:
+                print(f"❌ File checksum mismatch for {file_id}")
+                final_file_path.unlink(missing_ok=True)
+                return JSONResponse(
+                    content={
+                        "success": False,
+                        "message": "File checksum mismatch; please upload the file again.",
+                        "file_id": file_id,
+                    },
+                    status_code=400,
+                )
+
+            # ⚡ Same file already ingested: reuse its index, skip parsing
+            existing_collection = get_ingested_collection(fingerprint)
+            if existing_collection:
+                response = attach_existing_collection(
+                    chat_id, file_id, chat_folder, existing_collection
+                )
+                claimed = False
+                return response
+
             # 🔍 Call Celery Task
             try:
                 result = celery_app.send_task(
                     "process_uploaded_file",
-                    args=[final_file_path, chat_id],
+                    args=[final_file_path, chat_id, fingerprint],
                 )
                 set_task_ids(chat_id, [result.id])
 
@@ -177,6 +334,9 @@ async def upload_chunk(
                     status_code=500,
                 )
 
+            # Handed off to the worker: keep the state so a retried final
+            # chunk does not assemble the file a second time.
+            claimed = False
             return JSONResponse(
                 content={
                     "success": True,
@@ -210,3 +370,37 @@ async def upload_chunk(
             status_code=500,
         )
 
+    finally:
+        # Any way out after taking the assembly claim other than a hand-off
+        # (errors, a checksum mismatch, a cancelled request) releases it, so
+        # the client can upload the file again.
+        if claimed:
+            try:
+                delete_upload_state(file_id)
+            except Exception as e:
+                print(f"⚠️ Failed to release upload state for {file_id}: {e}")
+
+
+@collections_router.get("/upload/status")
+async def upload_status(file_id: str, total_chunks: int):
+    """Report which chunks of a resumable upload the server still needs."""
+    if not 0 < total_chunks <= MAX_TOTAL_CHUNKS:
+        return JSONResponse(
+            content={
+                "success": False,
+                "message": f"total_chunks must be between 1 and {MAX_TOTAL_CHUNKS}.",
+            },
+            status_code=400,
+        )
+    missing = get_missing_chunks(file_id, total_chunks)
+    return JSONResponse(
+        content={
+            "success": True,
+            "file_id": file_id,
+            "total_chunks": total_chunks,
+            "received": total_chunks - len(missing),
+            "missing_chunks": missing,
+            "complete": is_upload_assembled(file_id),
+        },
+        status_code=200,
+    )
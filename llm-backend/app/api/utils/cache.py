@@ -1,4 +1,5 @@
 import redis
+from redis.client import NEVER_DECODE
 import os
 import json
 from dotenv import load_dotenv
@@ -40,12 +41,37 @@ def delete_stream(chat_id: str):
         print(f"❌ Failed to delete stream {stream_key}: {e}")
 
 
+def publish_stream_event(chat_id: str, message: dict):
+    """Append an event to the chat's Redis stream (same format as the workers)."""
+    stream_key = f"stream:{chat_id}"
+    safe_message = {
+        k: str(v) if isinstance(v, (bool, dict, list)) else v
+        for k, v in message.items()
+    }
+    redis_client.xadd(stream_key, safe_message)
+
+
+# Ingest workers keep an in-memory stop flag updated from this channel.
+STOP_FLAG_CHANNEL = os.getenv("STOP_FLAG_CHANNEL", "stop-flags")
+
+
+def publish_stop_flag(chat_id: str, value: bool):
+    """Push a stop flag change to the workers (after the key is written)."""
+    try:
+        redis_client.publish(
+            STOP_FLAG_CHANNEL, json.dumps({"chat_id": chat_id, "stop": value})
+        )
+    except Exception as e:
+        print(f"❌ Failed to publish stop flag for {chat_id}: {e}")
+
+
 def set_stop_flag(chat_id: str, value: bool):
     """
     Set a stop flag in Redis for a given chain ID.
     """
     key = f"isStop:{chat_id}"
     redis_client.set(key, str(value).lower())  # Store as "true"/"false"
+    publish_stop_flag(chat_id, value)
 
 
 def get_stop_flag(chat_id: str) -> bool:
@@ -64,6 +90,7 @@ def delete_stop_flag(chat_id: str):
     """
     key = f"isStop:{chat_id}"
     redis_client.delete(key)
+    publish_stop_flag(chat_id, False)
 
 
 def set_task_ids(chat_id: str, task_ids: list[str]):
@@ -92,4 +119,99 @@ def delete_task_ids(chat_id: str):
     redis_client.delete(key)
 
 
+# Upload fingerprint (sha256 of the file bytes) -> collection it was indexed into.
+INGEST_REGISTRY_TTL = int(os.getenv("INGEST_REGISTRY_TTL", str(30 * 24 * 3600)))
+
+
+def register_ingested_file(fingerprint: str, collection_name: str):
+    """
+    Record that the file with this fingerprint is fully indexed in a collection.
+    """
+    key = f"ingested:{fingerprint}"
+    redis_client.set(key, collection_name, ex=INGEST_REGISTRY_TTL)
+
+
+def get_ingested_collection(fingerprint: str):
+    """
+    Return the collection already holding this file, or None.
+    """
+    if not fingerprint:
+        return None
+    return redis_client.get(f"ingested:{fingerprint}")
+
+
+# Chunked uploads: one bit per received chunk, plus a claim key so exactly one
+# request assembles the file.
+UPLOAD_STATE_TTL = int(os.getenv("UPLOAD_STATE_TTL", str(24 * 3600)))
+# Upper bound on total_chunks: SETBIT at a client-chosen index would otherwise
+# let one request make Redis allocate a bitmap of up to 512MB.
+MAX_UPLOAD_CHUNKS = int(os.getenv("MAX_UPLOAD_CHUNKS", "400"))
+
+_MARK_CHUNK_SCRIPT = redis_client.register_script(
+    """
+    redis.call('SETBIT', KEYS[1], ARGV[1], 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    if redis.call('BITCOUNT', KEYS[1]) >= tonumber(ARGV[2]) then
+        if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[3]) then
+            return 1
+        end
+    end
+    return 0
+    """
+)
+
+
+def mark_chunk_received(file_id: str, chunk_index: int, total_chunks: int) -> bool:
+    """
+    Atomically record a received chunk.
+    Returns True only for the one request that completes the set of chunks.
+    """
+    if not 0 <= chunk_index < total_chunks <= MAX_UPLOAD_CHUNKS:
+        raise ValueError(f"Chunk {chunk_index} of {total_chunks} is out of bounds")
+    keys = [f"upload:{file_id}:chunks", f"upload:{file_id}:assembling"]
+    args = [chunk_index, total_chunks, UPLOAD_STATE_TTL]
+    return bool(_MARK_CHUNK_SCRIPT(keys=keys, args=args))
+
+
+def get_missing_chunks(file_id: str, total_chunks: int) -> list[int]:
+    """
+    Return the indices of chunks not yet received for an upload.
+    """
+    if not 0 < total_chunks <= MAX_UPLOAD_CHUNKS:
+        raise ValueError(f"total_chunks must be between 1 and {MAX_UPLOAD_CHUNKS}")
+    # One GET of the raw bitmap; bit i is the (7 - i % 8)th bit of byte i // 8.
+    bitmap = redis_client.execute_command(
+        "GET", f"upload:{file_id}:chunks", **{NEVER_DECODE: []}
+    ) or b""
+    return [
+        i
+        for i in range(total_chunks)
+        if i // 8 >= len(bitmap) or not bitmap[i // 8] >> (7 - i % 8) & 1
+    ]
+
+
+def is_upload_assembled(file_id: str) -> bool:
+    return bool(redis_client.exists(f"upload:{file_id}:assembling"))
+
+
+def set_upload_digest(file_id: str, digest: str):
+    """
+    Remember the whole-file SHA-256 the client announced for an upload.
+    """
+    redis_client.set(f"upload:{file_id}:sha256", digest.lower(), ex=UPLOAD_STATE_TTL)
+
+
+def get_upload_digest(file_id: str):
+    return redis_client.get(f"upload:{file_id}:sha256")
+
+
+def delete_upload_state(file_id: str):
+    """
+    Delete the chunk tracking keys for an upload.
+    """
+    redis_client.delete(
+        f"upload:{file_id}:chunks",
+        f"upload:{file_id}:assembling",
+        f"upload:{file_id}:sha256",
+    )
 
@@ -1,10 +1,10 @@
 from typing import List, Callable,Union
-import chromadb
 from textwrap import dedent
 from pydantic import BaseModel, Field
+import os
 import random
 import tiktoken
-from elasticsearch import Elasticsearch
+from elasticsearch import NotFoundError
 from app.src.agent.helper import AgentState, Struture
 import json
 from langchain_core.messages import HumanMessage, AIMessage
@@ -12,6 +12,8 @@ from pydantic import ValidationError
 
 
 from app.src.llm.query_helper import get_llm_object
+from app.src.utils.page_ids import page_document_id
+from app.src.db.search_clients import get_chroma_client, get_elastic_client
 
 import time
 
@@ -22,14 +24,12 @@ from typing import Optional, Dict, Any
 
 AWS_DEFAULT_REGION = "eu-central-1"
 AWS_MODEL_ID = "anthropic.claude-sonnet-4-20250514-v1:0"
-ELASTIC_HOST = "http://localhost:9200"
-es = Elasticsearch(
-    ELASTIC_HOST,
-    headers={
-        "Accept": "application/vnd.elasticsearch+json; compatible-with=8",
-        "Content-Type": "application/vnd.elasticsearch+json; compatible-with=8",
-    },
-)
+# Per-collection document records written at ingest (total_pages, file_hash, ...)
+DOCUMENT_METADATA_INDEX = os.getenv("DOCUMENT_METADATA_INDEX", "document-metadata")
+# Page indices are read by collection name; with a shared routed index that
+# name is a filtered alias, so the queries below work unchanged.
+# Optional shared Chroma collection, filtered by collection_name metadata.
+CHROMA_SHARED_COLLECTION = os.getenv("CHROMA_SHARED_COLLECTION", "")
 
 
 # def extract_valid_json(raw_response: str) -> Optional[Dict[str, Any]]:
@@ -96,7 +96,7 @@ def sample_pages_by_offset(
 ) -> List[str]:
     if not keywords:
         # === 🔹 Sample from all documents ===
-        count_result = es.count(index=index_name)
+        count_result = get_elastic_client().count(index=index_name)
         total_docs = count_result["count"]
 
         if total_docs == 0:
@@ -106,7 +106,7 @@ def sample_pages_by_offset(
 
         sampled_docs = []
         for offset in offsets:
-            res = es.search(
+            res = get_elastic_client().search(
                 index=index_name,
                 body={"query": {"match_all": {}}},
                 from_=offset,
@@ -124,7 +124,7 @@ def sample_pages_by_offset(
             "query": {"match": {"content": {"query": query_text, "operator": "and"}}}
         }
 
-        response = es.search(index=index_name, body=query, size=1000)
+        response = get_elastic_client().search(index=index_name, body=query, size=1000)
         hits = response["hits"]["hits"]
 
         if not hits:
@@ -134,6 +134,64 @@ def sample_pages_by_offset(
         return [hit["_source"].get("content", "") for hit in sampled_hits]
 
 
+def fetch_pages_by_id(
+    index_name: str, file_hash: str, pages: List[int]
+) -> Dict[int, str]:
+    """Fetch page contents directly by their deterministic IDs (no search)."""
+    ids = [page_document_id(index_name, file_hash, page) for page in pages]
+    if not ids:
+        return {}
+    response = get_elastic_client().mget(index=index_name, ids=ids)
+
+    page_map = {}
+    for doc in response["docs"]:
+        if not doc.get("found"):
+            continue
+        source = doc["_source"]
+        page = source.get("metadata", {}).get("page")
+        if isinstance(page, int):
+            page_map[page] = source["content"].strip()
+    return page_map
+
+
+def fetch_pages_by_range(index_name: str, start_page: int, end_page: int) -> Dict[int, str]:
+    """Fetch page contents with ``start_page <= metadata.page < end_page``."""
+    query = {
+        "query": {"range": {"metadata.page": {"gte": start_page, "lt": end_page}}},
+        "size": max(end_page - start_page, 0),
+    }
+    response = get_elastic_client().search(index=index_name, body=query)
+
+    page_map = {}
+    for hit in response["hits"]["hits"]:
+        page = hit["_source"].get("metadata", {}).get("page")
+        if isinstance(page, int):
+            page_map[page] = hit["_source"]["content"].strip()
+    return page_map
+
+
+def fetch_document_record(index_name: str) -> Dict[str, Any]:
+    """The collection's document record, or {} for indices ingested before records."""
+    try:
+        response = get_elastic_client().get(index=DOCUMENT_METADATA_INDEX, id=index_name.lower())
+    except NotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Failed to read document record for {index_name}: {e}")
+        return {}
+    return response["_source"]
+
+
+def last_page_number(index_name: str) -> int:
+    """Highest page number indexed in ``index_name`` (0 if it has no pages)."""
+    response = get_elastic_client().search(
+        index=index_name,
+        size=0,
+        aggs={"last_page": {"max": {"field": "metadata.page"}}},
+    )
+    return int(response["aggregations"]["last_page"]["value"] or 0)
+
+
 async def search_and_expand_with_neighbors_elastic(
     index_name: str,
     keywords: List[str] = None,
@@ -146,7 +204,7 @@ async def search_and_expand_with_neighbors_elastic(
         if not keywords:
             print("📘 No keywords provided — fetching all pages...")
             query = {"query": {"match_all": {}}, "size": 1}
-            response = es.search(index=index_name, body=query)
+            response = get_elastic_client().search(index=index_name, body=query)
             hits = response["hits"]["hits"]
             print(f"🔎 Hits returned: {len(hits)}")
             if not hits:
@@ -155,7 +213,13 @@ async def search_and_expand_with_neighbors_elastic(
                 return state
             meta = hits[0]["_source"].get("metadata", {})
             # print("meta  : ", meta)
-            total_pages = meta.get("total_pages")
+            # Document-level fields live in the document record; older indices
+            # still carry them on every page.
+            record = fetch_document_record(index_name)
+            total_pages = record.get("total_pages", meta.get("total_pages"))
+            if total_pages is None:
+                # No record and no per-page copy: count from the pages themselves.
+                total_pages = last_page_number(index_name)
             if state["total_pages"] == -1:
                 if total_pages == 0:
                     state["error"] = True
@@ -174,22 +238,16 @@ async def search_and_expand_with_neighbors_elastic(
             if start_page >= state["total_pages"]:
                 print("All pages processed.")
                 return state  # Exit early
-            # here  want to used starting and ending page
-            query = {
-                "query": {
-                    "range": {"metadata.page": {"gte": start_page, "lt": end_page}}
-                },
-                "size": chunk_size,
-            }
-            response = es.search(index=index_name, body=query)
-            hits = response["hits"]["hits"]
-
-            page_map = {}
-            for hit in hits:
-                meta = hit["_source"].get("metadata", {})
-                page = meta.get("page")
-                if isinstance(page, int):
-                    page_map[page] = hit["_source"]["content"].strip()
+            file_hash = record.get("file_hash") or meta.get("file_hash")
+            # Page numbers start at 1.
+            wanted = [page for page in range(start_page, end_page) if page >= 1]
+            page_map = (
+                fetch_pages_by_id(index_name, file_hash, wanted) if file_hash else {}
+            )
+            if len(page_map) < len(wanted):
+                # Indices written before deterministic page IDs, or pages of
+                # another revision than the record's (e.g. mid re-upload).
+                page_map = fetch_pages_by_range(index_name, start_page, end_page)
 
             selected_texts = list(page_map.values())
         else:
@@ -204,7 +262,7 @@ async def search_and_expand_with_neighbors_elastic(
                 "size": 10000,
             }
 
-            response = es.search(index=index_name, body=query)
+            response = get_elastic_client().search(index=index_name, body=query)
 
             hits = response["hits"]["hits"]
             print(f"🔎 Hits returned: {len(hits)}")
@@ -242,26 +300,39 @@ async def search_and_expand_with_neighbors_elastic(
             state["matched_pages"] = sorted(matched_pages)
             print(f"📘 Pages from subset + neighbors: {sorted(matched_pages)}")
 
-            # 3. Fetch all documents from index (up to 10k chunk_size by default)
-            print("📥 Fetching all documents from index...")
-            query = {
-                "query": {"terms": {"metadata.page": list(matched_pages)}},
-                "size": len(matched_pages),  # just enough to get them all
-            }
-
-            all_docs = es.search(
-                index=index_name,
-                body=query,
+            # 3. Fetch the matched pages and their neighbours
+            file_hash = next(
+                (
+                    hit["_source"].get("metadata", {}).get("file_hash")
+                    for hit in subset_hits
+                    if hit["_source"].get("metadata", {}).get("file_hash")
+                ),
+                None,
             )
-            hits_all_docs = all_docs["hits"]["hits"]
-            print(f"🔎 All Hits returned: {len(hits_all_docs)}")
+            if file_hash:
+                print("📥 Fetching matched pages by ID...")
+                page_map = fetch_pages_by_id(index_name, file_hash, sorted(matched_pages))
+            else:
+                # Indices written before deterministic page IDs
+                print("📥 Fetching all documents from index...")
+                query = {
+                    "query": {"terms": {"metadata.page": list(matched_pages)}},
+                    "size": len(matched_pages),  # just enough to get them all
+                }
+
+                all_docs = get_elastic_client().search(
+                    index=index_name,
+                    body=query,
+                )
+                hits_all_docs = all_docs["hits"]["hits"]
+                print(f"🔎 All Hits returned: {len(hits_all_docs)}")
 
-            page_map = {}
-            for hit in all_docs["hits"]["hits"]:
-                meta = hit["_source"].get("metadata", {})
-                page = meta.get("page")
-                if isinstance(page, int):
-                    page_map[page] = hit["_source"]["content"].strip()
+                page_map = {}
+                for hit in all_docs["hits"]["hits"]:
+                    meta = hit["_source"].get("metadata", {})
+                    page = meta.get("page")
+                    if isinstance(page, int):
+                        page_map[page] = hit["_source"]["content"].strip()
 
             # 4. Extract selected pages
             selected_texts = []
@@ -336,13 +407,21 @@ def generate_feeder_from_page_range(
         List[str]: List of feeder text chunks
     """
     # 1. Connect to ChromaDB
-    db = chromadb.HttpClient(host=chroma_host, port=8000)
-    collection = db.get_or_create_collection(collection_name)
+    db = get_chroma_client(chroma_host, 8000)
+    if CHROMA_SHARED_COLLECTION:
+        collection = db.get_or_create_collection(CHROMA_SHARED_COLLECTION)
+        where = {"collection_name": collection_name}
+    else:
+        collection = db.get_or_create_collection(collection_name)
+        where = None
 
     # 2. Fetch pages in the requested range
     page_count = end_page - start_page
     results = collection.get(
-        include=["documents"], offset=start_page, chunk_size=page_count
+        include=["documents"],
+        where=where,
+        offset=start_page,
+        limit=page_count,
     )
     # print("results : ",results)
     raw_pages = results.get("documents", [])
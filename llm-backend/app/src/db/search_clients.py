@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+import chromadb
+from elasticsearch import Elasticsearch
+
+ELASTIC_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
+# Keep-alive connections per Elasticsearch node, shared by all requests.
+ES_POOL_MAXSIZE = int(os.getenv("ES_POOL_MAXSIZE", "32"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "30"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+# Seconds between health checks of a cached client; failing clients are rebuilt.
+CLIENT_HEALTH_INTERVAL = float(os.getenv("CLIENT_HEALTH_INTERVAL", "60"))
+
+_clients = {}
+_last_checked = {}
+_client_locks = {}
+_lock = threading.Lock()
+
+
+def _client_lock(name: str) -> threading.Lock:
+    with _lock:
+        return _client_locks.setdefault(name, threading.Lock())
+
+
+def _get_or_create(name: str, factory, health_check):
+    client = _clients.get(name)
+    if client is not None and time.monotonic() - _last_checked.get(name, 0) < CLIENT_HEALTH_INTERVAL:
+        return client
+
+    # Per-client lock, taken outside the global one: a slow health check or
+    # rebuild holds up neither the other clients nor requests that already
+    # have a client to use.
+    lock = _client_lock(name)
+    if client is not None:
+        if not lock.acquire(blocking=False):
+            return client
+    else:
+        lock.acquire()
+    try:
+        client = _clients.get(name)
+        now = time.monotonic()
+        if client is not None and now - _last_checked.get(name, 0) >= CLIENT_HEALTH_INTERVAL:
+            _last_checked[name] = now
+            try:
+                healthy = bool(health_check(client))
+            except Exception as e:
+                print(f"⚠️ {name} health check failed: {e}")
+                healthy = False
+            if not healthy:
+                print(f"⚠️ Rebuilding unhealthy client {name}")
+                client = None
+        if client is None:
+            client = factory()
+            _clients[name] = client
+            _last_checked[name] = time.monotonic()
+        return client
+    finally:
+        lock.release()
+
+
+def get_elastic_client() -> Elasticsearch:
+    """Process-wide Elasticsearch client with a pooled, keep-alive transport."""
+    return _get_or_create(
+        "elasticsearch",
+        lambda: Elasticsearch(
+            ELASTIC_HOST,
+            headers={
+                "Accept": "application/vnd.elasticsearch+json; compatible-with=8",
+                "Content-Type": "application/vnd.elasticsearch+json; compatible-with=8",
+            },
+            connections_per_node=ES_POOL_MAXSIZE,
+            request_timeout=ES_REQUEST_TIMEOUT,
+            max_retries=ES_MAX_RETRIES,
+            retry_on_timeout=True,
+            retry_on_status=(429, 502, 503, 504),
+            http_compress=True,
+        ),
+        lambda client: client.ping(),
+    )
+
+
+def get_chroma_client(host: str, port: int = 8000):
+    """Process-wide Chroma HTTP client for ``host:port``."""
+    return _get_or_create(
+        f"chroma:{host}:{port}",
+        lambda: chromadb.HttpClient(host=host, port=port),
+        lambda client: client.heartbeat(),
+    )
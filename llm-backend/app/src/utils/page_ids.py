@@ -0,0 +1,12 @@
+import uuid
+
+
+def page_document_id(collection_name: str, file_hash: str, page_number: int) -> str:
+    """
+    Deterministic ID of one page of one file in one collection.
+
+    Must match the IDs assigned by the indexing tasks in
+    llm-celery/app/tasks/load_data/page_ids.py.
+    """
+    key = f"{collection_name.lower()}/{file_hash}/{page_number}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
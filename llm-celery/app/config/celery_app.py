@@ -17,11 +17,16 @@ else:
 
 print(f"Using Redis URL: {REDIS_URL}")  # Debugging line
 
+# Indexing batches go to their own queue, so they are not stuck behind the
+# parse tasks that are waiting for them. Workers must consume it as well
+# (-Q celery,indexing), ideally through a dedicated indexing worker.
+PIPELINE_INDEX_QUEUE = os.getenv("PIPELINE_INDEX_QUEUE", "indexing")
+
 # Initialize Celery
 celery_app = Celery("llm_worker_project", broker=REDIS_URL, backend=REDIS_URL)
 celery_app.conf.update(
     task_track_started=True,
-    worker_concurrency=1,
+    worker_concurrency=int(os.getenv("CELERY_WORKER_CONCURRENCY", "1")),
     worker_prefetch_multiplier=3,
     worker_max_tasks_per_child=10000,
     broker_connection_retry=True,
@@ -29,6 +34,10 @@ celery_app.conf.update(
     task_serializer="pickle",
     result_serializer="pickle",
     accept_content=["pickle", "json"],
+    task_routes={
+        "load_with_fitz_elastic": {"queue": PIPELINE_INDEX_QUEUE},
+        "load_with_fitz_chroma": {"queue": PIPELINE_INDEX_QUEUE},
+    },
 )
 
 # Autodiscover tasks
@@ -5,51 +5,91 @@ from typing import Any, Callable, Dict, List, Optional, Union, Tuple, Awaitable
 import logging
 import asyncio
 import pymupdf
-from pymupdf4llm import IdentifyHeaders, to_markdown
-from app.config.celery_app import celery_app
+from pymupdf4llm import IdentifyHeaders
+from app.config.celery_app import PIPELINE_INDEX_QUEUE, celery_app
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 # from llama_index.core.schema import Document
 from langchain_core.documents import Document
 
 import asyncio
+import threading
+import time
+from collections import Counter
 import websockets
-from app.tasks.load_data.cache import set_task_id, get_stop_flag, delete_stop_flag
+from app.tasks.load_data.cache import (
+    set_task_id,
+    get_stop_flag,
+    delete_stop_flag,
+    get_queue_depth,
+    start_ingest,
+)
+from app.tasks.load_data.pdf_probe import DocumentProfile, probe_pdf
+from app.tasks.load_data.page_ids import file_sha256
+from app.tasks.load_data.batch_format import encode_documents
+from app.tasks.load_data.page_store import PAGE_STORE_DIR, put_page_batch
+from app.tasks.load_data.page_renderer import (
+    PDF_RENDER_MODE,
+    create_render_pool,
+    TIER_TIMEOUT,
+    render_page,
+    render_page_range,
+)
 
 
 logger = logging.getLogger("uvicorn")
 
-try:
-    from llama_index.core.readers.base import BaseReader
-
-    # from llama_index.core.schema import Document as Document
-
-    print("Successfully imported LlamaIndex")
-except ImportError:
-    raise NotImplementedError("Please install 'llama_index'.")
-
 WEB_SOCKET_URL = os.getenv("WEB_SOCKET_URL", "ws://localhost:4000/ws/llm_message")
 
+PARSE_THREADS = 4
+# Backpressure for load_data: chunks parsing at once (0 = one per parse
+# worker), dispatched batches not yet indexed, and index queue length.
+PIPELINE_MAX_INFLIGHT_CHUNKS = int(os.getenv("PIPELINE_MAX_INFLIGHT_CHUNKS", "0"))
+PIPELINE_MAX_PENDING_BATCHES = int(os.getenv("PIPELINE_MAX_PENDING_BATCHES", "8"))
+PIPELINE_MAX_QUEUE_DEPTH = int(os.getenv("PIPELINE_MAX_QUEUE_DEPTH", "50"))
+PIPELINE_POLL_INTERVAL = float(os.getenv("PIPELINE_POLL_INTERVAL", "0.5"))
+# Seconds without any dispatched batch finishing after which parsing goes on
+# regardless (e.g. no worker is consuming the index queue).
+PIPELINE_MAX_WAIT = float(os.getenv("PIPELINE_MAX_WAIT", "120"))
+
 
 async def send_websocket_message(uri, message):
     async with websockets.connect(uri) as websocket:
         await websocket.send(message)
 
 
-class PDFMarkdownReader(BaseReader):
+class PDFMarkdownReader:
     """Read PDF files using PyMuPDF library with chunked page processing."""
 
     meta_filter: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
 
     def __init__(
-        self, meta_filter: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+        self,
+        meta_filter: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        render_mode: Optional[str] = None,
+        render_workers: Optional[int] = None,
+        max_inflight_chunks: Optional[int] = None,
     ):
         self.meta_filter = meta_filter
         self.processed_pages = 0
         self.total_pages = 0
         self.tasks = []
+        # Indexing tasks dispatched by load_data that have not finished yet.
+        self.pending_batches = []
+        # Batches load_data split the file into, and how many were sent.
+        self.total_batches = 0
+        self.dispatched_batches = 0
+        # Set when indexing stopped making progress; backpressure is off until it resumes.
+        self.index_stalled = False
+        # Parse threads keep their open document between chunks.
+        self._thread_docs = threading.local()
+        # "process" renders page ranges in worker processes instead of threads
+        self.render_mode = (render_mode or PDF_RENDER_MODE).lower()
+        self.render_workers = render_workers
+        self.max_inflight_chunks = max_inflight_chunks or PIPELINE_MAX_INFLIGHT_CHUNKS
 
     async def load_data(
         self,
@@ -60,12 +100,32 @@ class PDFMarkdownReader(BaseReader):
         batch_size: int = 50,
         page_chunk_size: int = 100,
         message_handler: Optional[Callable[[Dict[str, Any]], None]] = None,
+        profile: Optional[DocumentProfile] = None,
     ):
-        extra_info = extra_info or {}
-        hdr_info = IdentifyHeaders(file_path)
-        self.total_pages = pymupdf.open(file_path).page_count
+        extra_info = {**(extra_info or {})}
+        # Page IDs are derived from the file hash, so retried batches upsert in place.
+        extra_info.setdefault(
+            "file_hash", (profile and profile.file_hash) or file_sha256(file_path)
+        )
+        if profile is None:
+            profile = probe_pdf(file_path, extra_info["file_hash"])
+            if not profile.valid:
+                raise ValueError(f"Cannot read PDF {file_path}: {profile.error}")
+        # Header levels start from a page sample (or the cached full scan of
+        # this file) and are refined with the font statistics of rendered pages.
+        header_stats = profile.header_stats
+        self.total_pages = profile.page_count
         print("self.total_pages : ", self.total_pages)
 
+        page_chunks = [
+            range(i, min(i + page_chunk_size, self.total_pages))
+            for i in range(0, self.total_pages, page_chunk_size)
+        ]
+        self.total_batches = len(page_chunks)
+        self.dispatched_batches = 0
+        self.index_stalled = False
+        start_ingest(collection_name, chat_id, self.total_batches)
+
         if get_stop_flag(chat_id):
             if message_handler:
                 message_handler(
@@ -78,11 +138,6 @@ class PDFMarkdownReader(BaseReader):
                 )
             return
 
-        page_chunks = [
-            range(i, min(i + page_chunk_size, self.total_pages))
-            for i in range(0, self.total_pages, page_chunk_size)
-        ]
-
         if message_handler:
             message_handler(
                 chat_id,
@@ -94,94 +149,245 @@ class PDFMarkdownReader(BaseReader):
             )
 
         loop = asyncio.get_event_loop()
-        tasks = []
-
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            for chunk_index, chunk in enumerate(page_chunks):
-                if get_stop_flag(chat_id):
-                    return
 
-                task = loop.run_in_executor(
+        render_pool = None
+        if self.render_mode == "process":
+            render_pool = create_render_pool(file_path, self.render_workers)
+        parse_workers = (
+            render_pool._max_workers if render_pool is not None else PARSE_THREADS
+        )
+        # Parsed-but-undispatched chunks never exceed this, whatever the page count.
+        max_inflight = self.max_inflight_chunks or parse_workers
+
+        with ThreadPoolExecutor(max_workers=PARSE_THREADS) as executor, render_pool or nullcontext():
+
+            def submit(chunk_index: int, chunk: range):
+                if render_pool is not None:
+                    return asyncio.ensure_future(
+                        self._process_doc_pages_in_pool(
+                            render_pool,
+                            file_path,
+                            chunk,
+                            chat_id,
+                            extra_info,
+                            header_stats.levels(),
+                            chunk_index,
+                            len(page_chunks),
+                        )
+                    )
+                return loop.run_in_executor(
                     executor,
                     self._process_doc_pages_sync,
                     file_path,
                     chunk,
                     chat_id,
                     extra_info,
-                    hdr_info,
+                    header_stats.levels(),
                     chunk_index,
                     len(page_chunks),
                     message_handler,
                     loop,
                 )
-                tasks.append(task)
-
-            # Process results as they complete
-            for future in asyncio.as_completed(tasks):
-                try:
-                    result, message = await future
 
-                    if message["type"] == "error":
-                        if message_handler:
-                            message_handler(chat_id, message)
+            next_chunks = iter(enumerate(page_chunks))
+            pending = set()
+            exhausted = False
+            # Throughput and parse tier mix reported with each chunk.
+            started = time.perf_counter()
+            parsed_pages = 0
+            tier_totals = Counter()
+            slow_pages = []
+
+            while True:
+                # Keep at most max_inflight chunks parsing, and only start a new
+                # one while the indexing side has room for its batch.
+                while not exhausted and len(pending) < max_inflight:
+                    if get_stop_flag(chat_id):
+                        return
+                    if not await self._wait_for_index_capacity(chat_id, message_handler):
                         return
+                    try:
+                        chunk_index, chunk = next(next_chunks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(submit(chunk_index, chunk))
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
 
-                    if message_handler:
-                        message_handler(
-                            chat_id,
-                            {
-                                "type": "chunk",
-                                "message": f"Chunk {message['chunk_index']}/{message['total_chunks']} processed successfully.",
-                                "isFinished": False,
-                            },
+                # Process results as they complete
+                for future in done:
+                    try:
+                        result, message = await future
+
+                        if message["type"] == "error":
+                            if message_handler:
+                                message_handler(chat_id, message)
+                            return
+
+                        parsed_pages += message["processed_pages"]
+                        tier_totals.update(message.get("tiers", {}))
+                        slow_pages.extend(message.get("slow_pages", []))
+                        header_stats.add_many(message.get("font_stats", []))
+                        elapsed = time.perf_counter() - started
+                        pages_per_sec = parsed_pages / elapsed if elapsed else 0.0
+                        tier_mix = ", ".join(
+                            f"{tier}: {count}" for tier, count in sorted(tier_totals.items())
+                        )
+                        print(
+                            f"[Parse] {parsed_pages}/{self.total_pages} pages, "
+                            f"{pages_per_sec:.1f} pages/s ({tier_mix})"
                         )
 
-                    if result:
-                        try:
-                            self._send_to_celery(
-                                documents=result,
-                                collection_name=collection_name,
-                                chat_id=chat_id,
-                                current_batch_number=message["chunk_index"],
-                                total_batches=len(page_chunks),
-                                message_handler=message_handler,
+                        if message_handler:
+                            message_handler(
+                                chat_id,
+                                {
+                                    "type": "chunk",
+                                    "message": f"Chunk {message['chunk_index']}/{message['total_chunks']} processed successfully ({pages_per_sec:.1f} pages/s; {tier_mix}).",
+                                    "processed_pages": parsed_pages,
+                                    "pages_per_sec": round(pages_per_sec, 2),
+                                    "tiers": dict(tier_totals),
+                                    "slow_pages": sorted(slow_pages),
+                                    "isFinished": False,
+                                },
                             )
-                        except Exception as e:
-                            error_message = f"Failed to send chunk {message['chunk_index']} to Celery: {e}"
-                            print(error_message)
+
+                        if result:
+                            try:
+                                self._send_to_celery(
+                                    documents=result,
+                                    collection_name=collection_name,
+                                    chat_id=chat_id,
+                                    current_batch_number=message["chunk_index"],
+                                    total_batches=len(page_chunks),
+                                    message_handler=message_handler,
+                                )
+                            except Exception as e:
+                                error_message = f"Failed to send chunk {message['chunk_index']} to Celery: {e}"
+                                print(error_message)
+                                if message_handler:
+                                    message_handler(
+                                        chat_id,
+                                        {
+                                            "type": "error",
+                                            "message": error_message,
+                                            "isFinished": False,
+                                        },
+                                    )
+                                return
+                        else:
                             if message_handler:
                                 message_handler(
                                     chat_id,
                                     {
                                         "type": "error",
-                                        "message": error_message,
+                                        "message": f"Failed to read chunk {message['chunk_index']}.",
                                         "isFinished": False,
                                     },
                                 )
                             return
-                    else:
+
+                    except Exception as e:
                         if message_handler:
                             message_handler(
                                 chat_id,
                                 {
                                     "type": "error",
-                                    "message": f"Failed to read chunk {message['chunk_index']}.",
+                                    "message": f"Failed to process a chunk: {e}",
                                     "isFinished": False,
                                 },
                             )
                         return
 
-                except Exception as e:
-                    if message_handler:
-                        message_handler(
-                            chat_id,
-                            {
-                                "type": "error",
-                                "message": f"Failed to process a chunk: {e}",
-                                "isFinished": False,
-                            },
-                        )
-                    return
+    async def _wait_for_index_capacity(
+        self,
+        chat_id: str,
+        message_handler: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> bool:
+        """
+        Wait until indexing can take another batch: fewer than
+        PIPELINE_MAX_PENDING_BATCHES of our dispatched batches unfinished and
+        the index queue shorter than PIPELINE_MAX_QUEUE_DEPTH.
+
+        Gives up waiting once neither has moved for PIPELINE_MAX_WAIT seconds
+        (and until they move again), so a missing or busy index worker slows
+        the upload down instead of stalling it.
+
+        Returns False if the user stopped the upload while waiting.
+        """
+        notified = False
+        last_progress = time.monotonic()
+        last_queued = None
+        while True:
+            running = [r for r in self.pending_batches if not r.ready()]
+            queued = get_queue_depth(PIPELINE_INDEX_QUEUE)
+            if len(running) < len(self.pending_batches) or (
+                last_queued is not None and queued < last_queued
+            ):
+                last_progress = time.monotonic()
+                self.index_stalled = False
+            self.pending_batches = running
+            last_queued = queued
+            pending = len(running)
+            if pending < PIPELINE_MAX_PENDING_BATCHES and queued < PIPELINE_MAX_QUEUE_DEPTH:
+                return True
+            if get_stop_flag(chat_id):
+                return False
+            if self.index_stalled or time.monotonic() - last_progress >= PIPELINE_MAX_WAIT:
+                if not self.index_stalled:
+                    print(
+                        f"[Pipeline] No indexing progress for {PIPELINE_MAX_WAIT:.0f}s "
+                        f"({pending} batches pending, {queued} tasks queued); "
+                        "dispatching without waiting"
+                    )
+                self.index_stalled = True
+                return True
+            if not notified:
+                print(
+                    f"[Pipeline] Waiting for indexing: {pending} batches pending, "
+                    f"{queued} tasks queued"
+                )
+                if message_handler:
+                    message_handler(
+                        chat_id,
+                        {
+                            "type": "chunk",
+                            "message": "Waiting for indexing to catch up...",
+                            "isFinished": False,
+                        },
+                    )
+                notified = True
+            await asyncio.sleep(PIPELINE_POLL_INTERVAL)
+
+    def load_page_range(
+        self,
+        file_path: Union[str, Path],
+        pages: range,
+        chat_id: str,
+        hdr_info: IdentifyHeaders,
+        extra_info: Optional[Dict[str, Any]] = None,
+    ) -> List[Document]:
+        """Parse one page range synchronously (used by fan-out parse tasks)."""
+        docs, message = self._process_doc_pages_sync(
+            file_path, pages, chat_id, extra_info or {}, hdr_info, 0, 1
+        )
+        if message["type"] == "error":
+            raise RuntimeError(message["message"])
+        return docs
+
+    def _thread_document(self, file_path: Union[str, Path]) -> pymupdf.Document:
+        """The calling thread's open copy of ``file_path``, reused across chunks."""
+        cached = getattr(self._thread_docs, "doc", None)
+        if cached is not None and cached.name == str(file_path) and not cached.is_closed:
+            return cached
+        self._thread_docs.doc = pymupdf.open(file_path)
+        return self._thread_docs.doc
 
     def _process_single_page(
         self,
@@ -193,21 +399,12 @@ class PDFMarkdownReader(BaseReader):
         hdr_info: IdentifyHeaders,
         message_handler: Optional[Callable[[Dict[str, Any]], None]] = None,
         loop: Optional[asyncio.AbstractEventLoop] = None,
-    ) -> Optional[Document]:
+    ) -> Optional[Tuple[Document, str, Dict[int, int]]]:
         try:
             if get_stop_flag(chat_id):
-                return []
+                return None
 
-            # doc = pymupdf.open(file_path)
-            page = doc[page_number]
-
-            page_info = {
-                **(extra_info or {}),
-                **doc.metadata,
-                "page": page_number + 1,
-                "total_pages": len(doc),
-                "file_path": str(file_path),
-            }
+            page_info = self._page_metadata(page_number, extra_info)
 
             # ✅ Send message only for every 10th page
             if message_handler and ((page_number + 1) % 30 == 0 or page_number == 0):
@@ -222,18 +419,13 @@ class PDFMarkdownReader(BaseReader):
                     },
                 )
 
-            try:
-                text = to_markdown(
-                    doc,
-                    pages=[page_number],
-                    hdr_info=hdr_info,
-                    write_images=False,
-                    show_progress=False,
-                )
-            except Exception:
-                text = page.get_text("text") or "[Page content could not be read]"
+            text, tier, fontsizes = render_page(doc, page_number, hdr_info)
 
-            return Document(page_content=text, metadata=page_info, id=page_number)
+            return (
+                Document(page_content=text, metadata=page_info, id=page_number),
+                tier,
+                fontsizes,
+            )
 
         except Exception as e:
             print(f"[Error] Failed processing page {page_number}: {e}")
@@ -253,7 +445,10 @@ class PDFMarkdownReader(BaseReader):
     ) -> Tuple[List[Document], Dict[str, Any]]:
         try:
             docs = []
-            doc = pymupdf.open(file_path)  # ✅ open once
+            tiers = Counter()
+            slow_pages = []
+            font_stats = []
+            doc = self._thread_document(file_path)  # ✅ open once per parse thread
 
             with ThreadPoolExecutor(max_workers=6) as executor:
                 future_to_page = {
@@ -274,24 +469,103 @@ class PDFMarkdownReader(BaseReader):
                 for future in as_completed(future_to_page):
                     page_result = future.result()
                     if page_result:
-                        docs.append(page_result)
+                        page_doc, tier, fontsizes = page_result
+                        docs.append(page_doc)
+                        tiers[tier] += 1
+                        font_stats.append((page_doc.metadata["page"] - 1, fontsizes))
+                        if tier == TIER_TIMEOUT:
+                            slow_pages.append(page_doc.metadata["page"])
             docs.sort(key=lambda d: d.metadata["page"])
 
-            return docs, {
-                "type": "chunk",
-                "message": f"Chunk {chunk_index + 1}/{total_chunks} processed in parallel.",
-                "chunk_index": chunk_index + 1,
-                "total_chunks": total_chunks,
-                "processed_pages": len(docs),
-                "isFinished": False,
+            return docs, self._chunk_message(
+                docs, chunk_index, total_chunks, tiers, sorted(slow_pages), font_stats
+            )
+
+        except Exception as e:
+            return [], {
+                "type": "error",
+                "message": f"Error processing chunk {chunk_index + 1}: {e}",
             }
 
+    async def _process_doc_pages_in_pool(
+        self,
+        render_pool: ProcessPoolExecutor,
+        file_path: Union[str, Path],
+        pages: range,
+        chat_id: str,
+        extra_info: Dict[str, Any],
+        hdr_info: IdentifyHeaders,
+        chunk_index: int,
+        total_chunks: int,
+    ) -> Tuple[List[Document], Dict[str, Any]]:
+        """Render a contiguous page range in a worker process."""
+        try:
+            loop = asyncio.get_running_loop()
+            rendered = await loop.run_in_executor(
+                render_pool,
+                render_page_range,
+                pages.start,
+                pages.stop,
+                hdr_info,
+                chat_id,
+            )
+            docs = [
+                Document(
+                    page_content=text,
+                    metadata=self._page_metadata(page_number, extra_info),
+                    id=page_number,
+                )
+                for page_number, text, _tier, _fontsizes in rendered
+            ]
+            tiers = Counter(tier for _, _, tier, _ in rendered)
+            slow_pages = [
+                page_number + 1
+                for page_number, _, tier, _ in rendered
+                if tier == TIER_TIMEOUT
+            ]
+            font_stats = [
+                (page_number, fontsizes) for page_number, _, _, fontsizes in rendered
+            ]
+
+            return docs, self._chunk_message(
+                docs, chunk_index, total_chunks, tiers, slow_pages, font_stats
+            )
+
         except Exception as e:
             return [], {
                 "type": "error",
                 "message": f"Error processing chunk {chunk_index + 1}: {e}",
             }
 
+    @staticmethod
+    def _page_metadata(
+        page_number: int, extra_info: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        # Document-level metadata (title, author, page count...) lives in the
+        # collection's document record, not on every page.
+        return {**(extra_info or {}), "page": page_number + 1}
+
+    @staticmethod
+    def _chunk_message(
+        docs: List[Document],
+        chunk_index: int,
+        total_chunks: int,
+        tiers: Optional[Dict[str, int]] = None,
+        slow_pages: Optional[List[int]] = None,
+        font_stats: Optional[List[Tuple[int, Dict[int, int]]]] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "type": "chunk",
+            "message": f"Chunk {chunk_index + 1}/{total_chunks} processed in parallel.",
+            "chunk_index": chunk_index + 1,
+            "total_chunks": total_chunks,
+            "processed_pages": len(docs),
+            "tiers": dict(tiers or {}),
+            "slow_pages": slow_pages or [],
+            "font_stats": font_stats or [],
+            "isFinished": False,
+        }
+
     # REMOVE @staticmethod
     def _send_to_celery(
         self,
@@ -306,18 +580,35 @@ class PDFMarkdownReader(BaseReader):
             # serialized_docs = [
             #     {"text": doc.text, "extra_info": doc.extra_info} for doc in documents
             # ]
+            # Compact columnar batch instead of pickled Document objects.
+            if PAGE_STORE_DIR and documents:
+                # Claim check: the pages go to the page store, the broker
+                # message only carries where to find them.
+                payload = put_page_batch(
+                    documents,
+                    collection_name,
+                    documents[0].metadata["page"],
+                    documents[-1].metadata["page"],
+                )
+                serializer = "json"
+            else:
+                payload, serializer = encode_documents(documents), None
+
             result = celery_app.send_task(
                 "load_with_fitz_elastic",
                 args=[
-                    documents,
+                    payload,
                     collection_name,
                     chat_id,
                     current_batch_number,
                     total_batches,
                 ],
+                serializer=serializer,
             )
 
             # self.tasks.append(result.id)
+            self.pending_batches.append(result)
+            self.dispatched_batches += 1
             set_task_id(chat_id, result.id)
 
             if message_handler:
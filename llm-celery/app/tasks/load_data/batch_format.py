@@ -0,0 +1,214 @@
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+# Wire format for parsed page batches handed from parsing to indexing:
+#
+#   b"PGB" | version:u8 | codec:u8 | compressed body
+#
+#   body = header_len:u32 | header (JSON: shared document metadata)
+#        | n:u32 | page:u32[n] | token_count:u32[n] | text_len:u32[n]
+#        | texts (UTF-8, concatenated)
+#        | extras_len:u32 | extras (JSON list of per-page metadata, or empty)
+#
+# All integers are little-endian.
+BATCH_MAGIC = b"PGB"
+BATCH_FORMAT_VERSION = 1
+
+CODEC_NONE = 0
+CODEC_ZSTD = 1
+CODEC_LZ4 = 2
+CODEC_ZLIB = 3
+
+BATCH_CODEC = os.getenv("BATCH_CODEC", "zstd").lower()
+BATCH_COMPRESSION_LEVEL = int(os.getenv("BATCH_COMPRESSION_LEVEL", "3"))
+
+
+def _compress(body: bytes, codec_name: str) -> Tuple[int, bytes]:
+    if codec_name == "zstd":
+        try:
+            import zstandard
+
+            return CODEC_ZSTD, zstandard.ZstdCompressor(level=BATCH_COMPRESSION_LEVEL).compress(body)
+        except ImportError:
+            codec_name = "lz4"
+    if codec_name == "lz4":
+        try:
+            import lz4.frame
+
+            return CODEC_LZ4, lz4.frame.compress(body)
+        except ImportError:
+            codec_name = "zlib"
+    if codec_name == "zlib":
+        return CODEC_ZLIB, zlib.compress(body, BATCH_COMPRESSION_LEVEL)
+    return CODEC_NONE, body
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_LZ4:
+        import lz4.frame
+
+        return lz4.frame.decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_NONE:
+        return data
+    raise ValueError(f"Unknown page batch codec {codec}")
+
+
+def count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+class PageBatch:
+    """A decoded page batch: shared metadata plus per-page columns."""
+
+    __slots__ = ("metadata", "pages", "texts", "token_counts", "extras")
+
+    def __init__(
+        self,
+        metadata: Dict[str, Any],
+        pages: List[int],
+        texts: List[str],
+        token_counts: List[int],
+        extras: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.metadata = metadata
+        self.pages = pages
+        self.texts = texts
+        self.token_counts = token_counts
+        self.extras = extras
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def page_metadata(self, i: int) -> Dict[str, Any]:
+        return {
+            **self.metadata,
+            **(self.extras[i] if self.extras else {}),
+            "page": self.pages[i],
+            "token_count": self.token_counts[i],
+        }
+
+    def to_documents(self) -> List[Document]:
+        return [
+            Document(page_content=self.texts[i], metadata=self.page_metadata(i))
+            for i in range(len(self))
+        ]
+
+
+def encode_batch(
+    metadata: Dict[str, Any],
+    pages: List[int],
+    texts: List[str],
+    token_counts: Optional[List[int]] = None,
+    extras: Optional[List[Dict[str, Any]]] = None,
+    codec: str = BATCH_CODEC,
+) -> bytes:
+    n = len(pages)
+    token_counts = token_counts if token_counts is not None else [count_tokens(t) for t in texts]
+    encoded_texts = [t.encode("utf-8") for t in texts]
+    header = json.dumps(metadata, ensure_ascii=False, default=str).encode("utf-8")
+    extras_blob = (
+        json.dumps(extras, ensure_ascii=False, default=str).encode("utf-8")
+        if extras and any(extras)
+        else b""
+    )
+
+    body = b"".join(
+        [
+            struct.pack("<I", len(header)),
+            header,
+            struct.pack("<I", n),
+            struct.pack(f"<{n}I", *pages),
+            struct.pack(f"<{n}I", *token_counts),
+            struct.pack(f"<{n}I", *(len(t) for t in encoded_texts)),
+            *encoded_texts,
+            struct.pack("<I", len(extras_blob)),
+            extras_blob,
+        ]
+    )
+    codec_id, compressed = _compress(body, codec)
+    return BATCH_MAGIC + bytes([BATCH_FORMAT_VERSION, codec_id]) + compressed
+
+
+def decode_batch(payload: bytes) -> PageBatch:
+    if payload[:3] != BATCH_MAGIC:
+        raise ValueError("Not a page batch")
+    version, codec = payload[3], payload[4]
+    if version != BATCH_FORMAT_VERSION:
+        raise ValueError(f"Unsupported page batch version {version}")
+    body = memoryview(_decompress(codec, payload[5:]))
+
+    pos = 0
+
+    def read_u32s(count: int) -> List[int]:
+        nonlocal pos
+        values = list(struct.unpack_from(f"<{count}I", body, pos))
+        pos += 4 * count
+        return values
+
+    (header_len,) = read_u32s(1)
+    metadata = json.loads(bytes(body[pos : pos + header_len]))
+    pos += header_len
+    (n,) = read_u32s(1)
+    pages = read_u32s(n)
+    token_counts = read_u32s(n)
+    text_lengths = read_u32s(n)
+    texts = []
+    for length in text_lengths:
+        texts.append(str(body[pos : pos + length], "utf-8"))
+        pos += length
+    (extras_len,) = read_u32s(1)
+    extras = json.loads(bytes(body[pos : pos + extras_len])) if extras_len else None
+
+    return PageBatch(metadata, pages, texts, token_counts, extras)
+
+
+def encode_documents(documents: List[Document], codec: str = BATCH_CODEC) -> bytes:
+    """
+    Encode LangChain page documents; metadata shared by every page is written
+    once in the header instead of once per page.
+    """
+    metadatas = [dict(d.metadata) for d in documents]
+    shared = dict(metadatas[0]) if metadatas else {}
+    for meta in metadatas[1:]:
+        shared = {k: v for k, v in shared.items() if k in meta and meta[k] == v}
+    shared.pop("page", None)
+    shared.pop("token_count", None)
+
+    extras = [
+        {
+            k: v
+            for k, v in meta.items()
+            if k not in shared and k not in ("page", "token_count")
+        }
+        for meta in metadatas
+    ]
+    return encode_batch(
+        shared,
+        [int(meta.get("page", 0)) for meta in metadatas],
+        [d.page_content for d in documents],
+        extras=extras,
+        codec=codec,
+    )
+
+
+def iter_page_records(
+    documents: Union[PageBatch, List[Document]]
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield ``(text, metadata)`` per page from a batch or a list of documents."""
+    if isinstance(documents, PageBatch):
+        for i in range(len(documents)):
+            yield documents.texts[i], documents.page_metadata(i)
+    else:
+        for doc in documents:
+            yield doc.page_content, doc.metadata
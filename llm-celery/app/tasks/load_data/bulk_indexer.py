@@ -0,0 +1,136 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from celery.utils.log import get_task_logger
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import streaming_bulk
+
+logger = get_task_logger(__name__)
+
+# A bulk request is closed once either limit is reached.
+ES_BULK_MAX_DOCS = int(os.getenv("ES_BULK_MAX_DOCS", "500"))
+ES_BULK_MAX_BYTES = int(os.getenv("ES_BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+# Number of bulk requests in flight at once.
+ES_BULK_THREADS = int(os.getenv("ES_BULK_THREADS", "4"))
+# Retries for items rejected with 429; accepted items are never re-sent.
+ES_BULK_MAX_RETRIES = int(os.getenv("ES_BULK_MAX_RETRIES", "3"))
+
+
+def action_size(action: Dict[str, Any]) -> int:
+    """Approximate size in bytes of an action once serialized as bulk NDJSON."""
+    source = action.get("_source", {})
+    header = {k: v for k, v in action.items() if k != "_source"}
+    return len(json.dumps(header, default=str)) + len(
+        json.dumps(source, default=str, ensure_ascii=False).encode("utf-8")
+    ) + 2
+
+
+def split_batches(
+    actions: List[Dict[str, Any]],
+    max_docs: int = ES_BULK_MAX_DOCS,
+    max_bytes: int = ES_BULK_MAX_BYTES,
+) -> List[Tuple[List[Dict[str, Any]], int]]:
+    """Group actions into ``(batch, size_in_bytes)`` pairs bounded by count and bytes."""
+    batches = []
+    batch, batch_bytes = [], 0
+    for action in actions:
+        size = action_size(action)
+        if batch and (len(batch) >= max_docs or batch_bytes + size > max_bytes):
+            batches.append((batch, batch_bytes))
+            batch, batch_bytes = [], 0
+        batch.append(action)
+        batch_bytes += size
+    if batch:
+        batches.append((batch, batch_bytes))
+    return batches
+
+
+def _send_batch(
+    es: Elasticsearch,
+    batch: List[Dict[str, Any]],
+    batch_bytes: int,
+    batch_number: int,
+    max_bytes: int,
+    max_retries: int,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    indexed, failed = 0, []
+
+    for ok, item in streaming_bulk(
+        es,
+        batch,
+        chunk_size=len(batch),
+        max_chunk_bytes=max(max_bytes, batch_bytes),
+        max_retries=max_retries,
+        raise_on_error=False,
+        raise_on_exception=False,
+    ):
+        if ok:
+            indexed += 1
+        else:
+            failed.append(item)
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "batch": batch_number,
+        "docs": len(batch),
+        "indexed": indexed,
+        "failed": len(failed),
+        "bytes": batch_bytes,
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(batch) / elapsed, 1) if elapsed else None,
+        "mb_per_sec": round(batch_bytes / elapsed / 1_000_000, 2) if elapsed else None,
+    }
+    logger.info(f"[Bulk] {stats}")
+    for item in failed:
+        logger.error(f"❌ Failed to index document: {item}")
+    return stats
+
+
+def bulk_index(
+    es: Elasticsearch,
+    actions: List[Dict[str, Any]],
+    max_docs: int = ES_BULK_MAX_DOCS,
+    max_bytes: int = ES_BULK_MAX_BYTES,
+    thread_count: int = ES_BULK_THREADS,
+    max_retries: int = ES_BULK_MAX_RETRIES,
+) -> Dict[str, Any]:
+    """
+    Index ``actions`` with concurrent, size-bounded bulk requests.
+
+    Each batch is sent once; only items Elasticsearch rejects with 429 are
+    retried (with backoff) by ``streaming_bulk``. Returns a summary with the
+    per-batch throughput stats.
+    """
+    batches = split_batches(actions, max_docs=max_docs, max_bytes=max_bytes)
+    if not batches:
+        return {"docs": 0, "indexed": 0, "failed": 0, "batches": []}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(thread_count, len(batches)))) as pool:
+        batch_stats = list(
+            pool.map(
+                lambda numbered: _send_batch(
+                    es, numbered[1][0], numbered[1][1], numbered[0], max_bytes, max_retries
+                ),
+                enumerate(batches, start=1),
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    summary = {
+        "docs": len(actions),
+        "indexed": sum(s["indexed"] for s in batch_stats),
+        "failed": sum(s["failed"] for s in batch_stats),
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(actions) / elapsed, 1) if elapsed else None,
+        "batches": batch_stats,
+    }
+    logger.info(
+        f"[Bulk] {summary['indexed']}/{summary['docs']} docs in {len(batch_stats)} batches, "
+        f"{summary['docs_per_sec']} docs/s"
+    )
+    return summary
@@ -1,6 +1,10 @@
+import atexit
 import redis
 import os
 import json
+import threading
+import time
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,16 +34,205 @@ else:
 
 # Connect to Redis (adjust host/port/db/password as needed)
 
-def publish_stream_event(chat_id: str, message: dict):
-    stream_key = f"stream:{chat_id}"
+# Progress events are buffered per chat and written with one pipeline every
+# EVENT_FLUSH_INTERVAL seconds (or once EVENT_BATCH_SIZE are waiting).
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "0.25"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "50"))
+# Consecutive events of these types replace each other; only the latest is sent.
+EVENT_COALESCE_TYPES = set(
+    filter(None, os.getenv("EVENT_COALESCE_TYPES", "page,chunk").split(","))
+)
+# Events of these types (and any with isFinished) are flushed immediately.
+EVENT_FLUSH_TYPES = {"error", "stop", "task_complete", "no_content"}
+
+
+class StreamEventPublisher:
+    """
+    Buffers stream events per chat, coalesces consecutive progress updates
+    and writes them with a single pipelined round trip. Per-chat order is
+    kept. Safe to use from several threads; a forked child starts empty.
+    """
+
+    def __init__(self, client, flush_interval: float, batch_size: int):
+        self.client = client
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._buffer = {}
+        self._pending = 0
+        self._timer = None
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Events buffered by the parent are the parent's to send.
+            self._reset()
+
+    def publish(self, chat_id: str, message: dict):
+        self._check_fork()
+        event_type = message.get("type")
+        with self._lock:
+            events = self._buffer.setdefault(chat_id, [])
+            if (
+                events
+                and event_type in EVENT_COALESCE_TYPES
+                and events[-1][0] == event_type
+            ):
+                events[-1] = (event_type, message)
+            else:
+                events.append((event_type, message))
+                self._pending += 1
+            flush_now = (
+                event_type in EVENT_FLUSH_TYPES
+                or str(message.get("isFinished")).lower() == "true"
+                or self._pending >= self.batch_size
+            )
+            if not flush_now:
+                self._schedule_flush()
+        if flush_now:
+            self.flush()
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
 
+    def flush(self):
+        self._check_fork()
+        with self._lock:
+            buffer, self._buffer, self._pending = self._buffer, {}, 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not buffer:
+                return
+            # Written under the lock so a later flush cannot overtake this one.
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for chat_id, events in buffer.items():
+                    for _, message in events:
+                        pipe.xadd(f"stream:{chat_id}", message)
+                pipe.execute()
+            except redis.RedisError as e:
+                print(f"[Redis] Failed to publish {sum(map(len, buffer.values()))} stream events: {e}")
+
+
+_event_publisher = StreamEventPublisher(redis_client, EVENT_FLUSH_INTERVAL, EVENT_BATCH_SIZE)
+atexit.register(_event_publisher.flush)
+
+
+def publish_stream_event(chat_id: str, message: dict):
     # Convert all values to valid Redis types (str, int, float, bytes)
     safe_message = {
         k: str(v) if isinstance(v, (bool, dict, list)) else v
         for k, v in message.items()
     }
 
-    redis_client.xadd(stream_key, safe_message)
+    _event_publisher.publish(chat_id, safe_message)
+
+
+def flush_stream_events():
+    """Send every buffered stream event now."""
+    _event_publisher.flush()
+
+# Stop requests are published here (as well as stored under isStop:<chat_id>)
+# so workers keep an in-memory flag instead of polling Redis.
+STOP_FLAG_CHANNEL = os.getenv("STOP_FLAG_CHANNEL", "stop-flags")
+STOP_FLAG_PUSH = os.getenv("STOP_FLAG_PUSH", "1") == "1"
+
+
+class StopFlagWatcher:
+    """
+    In-process view of the stop flags, kept current by a pub/sub subscriber
+    thread. A chat's flag is read from Redis once, then served from memory.
+    While the subscription is down every check falls back to a GET; flags
+    are re-read after a reconnect since messages may have been missed.
+    """
+
+    def __init__(self, client, channel: str):
+        self.client = client
+        self.channel = channel
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flags = {}
+        self._connected = False
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            # The subscriber thread does not survive a fork.
+            self._reset()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="stop-flag-watcher", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        with self._lock:
+                            self._flags.clear()
+                            self._connected = True
+                    elif message["type"] == "message":
+                        self._apply(message["data"])
+            except Exception as e:
+                print(f"[Redis] Stop flag subscription lost: {e}")
+            with self._lock:
+                self._connected = False
+                self._flags.clear()
+            time.sleep(1)
+
+    def _apply(self, data):
+        try:
+            update = json.loads(data)
+            self.set_local(update["chat_id"], bool(update["stop"]))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[Redis] Ignoring malformed stop flag message {data!r}: {e}")
+
+    def set_local(self, chat_id: str, value: bool):
+        with self._lock:
+            if len(self._flags) > 10000:
+                self._flags.clear()
+            self._flags[chat_id] = value
+
+    def get(self, chat_id: str) -> bool:
+        self._ensure_started()
+        if not self._connected:
+            return _read_stop_flag(chat_id)
+        value = self._flags.get(chat_id)
+        if value is None:
+            value = _read_stop_flag(chat_id)
+            with self._lock:
+                # A message that arrived meanwhile is newer than this read.
+                value = self._flags.setdefault(chat_id, value)
+        return value
+
+
+_stop_flags = StopFlagWatcher(redis_client, STOP_FLAG_CHANNEL)
+
+
+def _read_stop_flag(chat_id: str) -> bool:
+    return redis_client.get(f"isStop:{chat_id}") == "true"
+
+
+def _publish_stop_flag(chat_id: str, value: bool):
+    redis_client.publish(STOP_FLAG_CHANNEL, json.dumps({"chat_id": chat_id, "stop": value}))
+    _stop_flags.set_local(chat_id, value)
+
 
 def set_stop_flag(chat_id: str, value: bool):
     """
@@ -47,16 +240,18 @@ def set_stop_flag(chat_id: str, value: bool):
     """
     key = f"isStop:{chat_id}"
     redis_client.set(key, str(value).lower())  # Store as "true"/"false"
+    _publish_stop_flag(chat_id, value)
 
 
 def get_stop_flag(chat_id: str) -> bool:
     """
-    Get the stop flag from Redis for a given chain ID.
-    Returns False if not set.
+    Get the stop flag for a given chain ID.
+    Returns False if not set. Served from memory once the chat's flag is
+    known; stop requests arrive through the pub/sub channel.
     """
-    key = f"isStop:{chat_id}"
-    value = redis_client.get(key)
-    return value == "true"
+    if not STOP_FLAG_PUSH:
+        return _read_stop_flag(chat_id)
+    return _stop_flags.get(chat_id)
 
 
 def delete_stop_flag(chat_id: str):
@@ -65,6 +260,16 @@ def delete_stop_flag(chat_id: str):
     """
     key = f"isStop:{chat_id}"
     redis_client.delete(key)
+    _publish_stop_flag(chat_id, False)
+
+
+def get_queue_depth(queue_name: str = "celery") -> int:
+    """Number of messages waiting in a Celery queue on the Redis broker."""
+    try:
+        return redis_client.llen(queue_name)
+    except redis.RedisError as e:
+        print(f"[Redis] Failed to read queue depth for {queue_name}: {e}")
+        return 0
 
 
 def set_task_id(chat_id: str, task_id: str):
@@ -92,4 +297,133 @@ def delete_task_ids(chat_id: str):
     redis_client.delete(key)
 
 
+# Upload fingerprint (sha256 of the file bytes) -> collection it was indexed into.
+INGEST_REGISTRY_TTL = int(os.getenv("INGEST_REGISTRY_TTL", str(30 * 24 * 3600)))
 
+
+def register_ingested_file(fingerprint: str, collection_name: str):
+    """
+    Record that the file with this fingerprint is fully indexed in a collection.
+    """
+    key = f"ingested:{fingerprint}"
+    redis_client.set(key, collection_name, ex=INGEST_REGISTRY_TTL)
+
+
+def unregister_ingested_file(fingerprint: str, collection_name: str):
+    """
+    Forget a fingerprint, if it still points at ``collection_name``.
+    """
+    key = f"ingested:{fingerprint}"
+    if redis_client.get(key) == collection_name:
+        redis_client.delete(key)
+
+
+def get_ingested_collection(fingerprint: str):
+    """
+    Return the collection already holding this file, or None.
+    """
+    if not fingerprint:
+        return None
+    return redis_client.get(f"ingested:{fingerprint}")
+
+
+# Per-ingest batch bookkeeping: which dispatched batches finished and how.
+INGEST_PROGRESS_TTL = int(os.getenv("INGEST_PROGRESS_TTL", str(24 * 3600)))
+
+# KEYS[1]: batch number -> 1 (indexed) / 0 (failed)
+# KEYS[2]: total (batches to wait for), failed (producer gave up), closed
+# Returns 1 or 0 (all batches indexed or not) to the one call that sees the
+# last batch finish, -1 to every other call.
+_RECORD_BATCH_SCRIPT = redis_client.register_script(
+    """
+    if ARGV[1] ~= '' then
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    end
+    if ARGV[3] ~= '' then
+        redis.call('HSET', KEYS[2], 'total', ARGV[3], 'failed', 1)
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    local total = redis.call('HGET', KEYS[2], 'total')
+    if not total or redis.call('HLEN', KEYS[1]) < tonumber(total) then
+        return -1
+    end
+    if redis.call('HSETNX', KEYS[2], 'closed', 1) == 0 then
+        return -1
+    end
+    if redis.call('HGET', KEYS[2], 'failed') then
+        return 0
+    end
+    for _, ok in ipairs(redis.call('HVALS', KEYS[1])) do
+        if ok ~= '1' then
+            return 0
+        end
+    end
+    return 1
+    """
+)
+
+
+def _ingest_keys(collection_name: str, chat_id: str) -> list[str]:
+    base = f"ingest:{collection_name.lower()}:{chat_id}"
+    return [f"{base}:batches", f"{base}:state"]
+
+
+def _run_record_batch(keys, batch_number="", ok=False, dispatched="") -> Optional[bool]:
+    result = _RECORD_BATCH_SCRIPT(
+        keys=keys,
+        args=[batch_number, "1" if ok else "0", dispatched, INGEST_PROGRESS_TTL],
+    )
+    return None if int(result) < 0 else bool(int(result))
+
+
+def start_ingest(collection_name: str, chat_id: str, total_batches: int):
+    """
+    Reset the batch bookkeeping of an ingest before its first batch is sent.
+    """
+    batches_key, state_key = _ingest_keys(collection_name, chat_id)
+    pipe = redis_client.pipeline()
+    pipe.delete(batches_key, state_key)
+    pipe.hset(state_key, "total", total_batches)
+    pipe.expire(state_key, INGEST_PROGRESS_TTL)
+    pipe.execute()
+
+
+def set_pending_document_record(collection_name: str, chat_id: str, record: dict):
+    """
+    Hold an ingest's document record until its last batch is indexed.
+    """
+    key = f"ingest:{collection_name.lower()}:{chat_id}:record"
+    redis_client.set(key, json.dumps(record), ex=INGEST_PROGRESS_TTL)
+
+
+def pop_pending_document_record(collection_name: str, chat_id: str):
+    key = f"ingest:{collection_name.lower()}:{chat_id}:record"
+    pipe = redis_client.pipeline()
+    pipe.get(key)
+    pipe.delete(key)
+    value, _ = pipe.execute()
+    return json.loads(value) if value else None
+
+
+def record_ingest_batch(
+    collection_name: str, chat_id: str, batch_number: int, ok: bool
+) -> Optional[bool]:
+    """
+    Record that a batch finished. Returns None while other batches are
+    outstanding; once the last one finishes, returns True to exactly one
+    caller if every batch was indexed and False otherwise.
+    """
+    keys = _ingest_keys(collection_name, chat_id)
+    return _run_record_batch(keys, batch_number, ok)
+
+
+def abort_ingest(
+    collection_name: str, chat_id: str, dispatched_batches: int
+) -> Optional[bool]:
+    """
+    Mark an ingest as failed after only ``dispatched_batches`` were sent, so
+    it completes (with False) once those have finished.
+    """
+    keys = _ingest_keys(collection_name, chat_id)
+    return _run_record_batch(keys, dispatched=dispatched_batches)
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+from celery.signals import worker_process_init
+from celery.utils.log import get_task_logger
+
+from app.tasks.load_data.embedding_pipeline import EMBED_THREADS
+
+logger = get_task_logger(__name__)
+
+ELASTIC_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
+# Keep-alive connections per Elasticsearch node; at least ES_BULK_THREADS.
+ES_POOL_MAXSIZE = int(os.getenv("ES_POOL_MAXSIZE", "16"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "30"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+# Seconds between health checks of a cached client; failing clients are rebuilt.
+CLIENT_HEALTH_INTERVAL = float(os.getenv("CLIENT_HEALTH_INTERVAL", "60"))
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2.gguf2.f16.gguf")
+# Load the embedding model and clients in the background when a worker
+# process starts, so the first task does not pay for it.
+CELERY_WARMUP = os.getenv("CELERY_WARMUP", "1") == "1"
+
+# Created on first use, once per process (re-created after a fork).
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+_client_locks = {}
+_last_checked = {}
+
+
+def _is_healthy(name: str, client, health_check) -> bool:
+    """Run ``health_check`` at most every CLIENT_HEALTH_INTERVAL seconds."""
+    if health_check is None:
+        return True
+    now = time.monotonic()
+    if now - _last_checked.get(name, 0) < CLIENT_HEALTH_INTERVAL:
+        return True
+    _last_checked[name] = now
+    try:
+        return bool(health_check(client))
+    except Exception as e:
+        logger.warning(f"[Clients] {name} health check failed: {e}")
+        return False
+
+
+def _get_or_create(name: str, factory, health_check=None):
+    global _clients_pid
+    client = _clients.get(name) if _clients_pid == os.getpid() else None
+    if client is not None:
+        if _is_healthy(name, client, health_check):
+            return client
+        logger.warning(f"[Clients] Rebuilding unhealthy client {name}")
+        _clients.pop(name, None)
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _client_locks.clear()
+            _last_checked.clear()
+            _clients_pid = os.getpid()
+        lock = _client_locks.setdefault(name, threading.Lock())
+    # Per-client lock: a slow model load does not hold up the other clients.
+    with lock:
+        if name not in _clients:
+            started = time.perf_counter()
+            _clients[name] = factory()
+            _last_checked[name] = time.monotonic()
+            logger.info(f"[Clients] {name} ready in {time.perf_counter() - started:.2f}s")
+        return _clients[name]
+
+
+def _create_embeddings():
+    from langchain_community.embeddings import GPT4AllEmbeddings
+
+    return GPT4AllEmbeddings(
+        model_name=EMBED_MODEL_NAME,
+        n_threads=EMBED_THREADS,
+        gpt4all_kwargs={"allow_download": "True"},
+    )
+
+
+def _create_elastic_client():
+    from elasticsearch import Elasticsearch
+
+    return Elasticsearch(
+        [ELASTIC_HOST],
+        connections_per_node=ES_POOL_MAXSIZE,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=True,
+        retry_on_status=(429, 502, 503, 504),
+        http_compress=True,
+    )
+
+
+def get_embeddings():
+    return _get_or_create("embeddings", _create_embeddings)
+
+
+def get_elastic_client():
+    return _get_or_create(
+        "elasticsearch", _create_elastic_client, lambda client: client.ping()
+    )
+
+
+def get_chroma_client(host: str, port: int = 8000):
+    def create():
+        import chromadb
+
+        return chromadb.HttpClient(host=host, port=port)
+
+    return _get_or_create(
+        f"chroma:{host}:{port}", create, lambda client: client.heartbeat()
+    )
+
+
+def warm_up():
+    try:
+        get_elastic_client()
+        get_embeddings()
+    except Exception as e:
+        logger.warning(f"[Clients] Warm-up failed, clients will load on first use: {e}")
+
+
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    # worker_process_init must return quickly, so load in the background.
+    if CELERY_WARMUP:
+        threading.Thread(target=warm_up, name="client-warmup", daemon=True).start()
@@ -0,0 +1,90 @@
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from elasticsearch import NotFoundError
+
+from app.tasks.load_data.elastic_index import ensure_index
+from app.tasks.load_data.pdf_probe import DocumentProfile
+
+# One record per collection with the document-level metadata (title, author,
+# producer, dates, page count...). Page documents carry only page fields.
+DOCUMENT_METADATA_INDEX = os.getenv("DOCUMENT_METADATA_INDEX", "document-metadata")
+
+DOCUMENT_METADATA_MAPPINGS = {
+    "dynamic": False,
+    "properties": {
+        "collection_name": {"type": "keyword"},
+        "file_hash": {"type": "keyword"},
+        # Chat that uploaded this revision; a later upload into the collection
+        # from the same chat replaces it.
+        "chat_id": {"type": "keyword"},
+        "file_name": {"type": "keyword"},
+        "total_pages": {"type": "integer"},
+        "is_encrypted": {"type": "boolean"},
+        "page_sizes": {"type": "object", "enabled": False},
+        "metadata": {"type": "object", "enabled": False},
+        "indexed_at": {"type": "date"},
+    },
+}
+
+
+def document_record(
+    collection_name: str, profile: DocumentProfile, chat_id: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "collection_name": collection_name,
+        "file_hash": profile.file_hash,
+        "chat_id": chat_id,
+        "file_name": os.path.basename(profile.file_path),
+        "total_pages": profile.page_count,
+        "is_encrypted": profile.is_encrypted,
+        "page_sizes": [
+            {"width": width, "height": height, "pages": count}
+            for (width, height), count in profile.page_sizes
+        ],
+        "metadata": {k: v for k, v in profile.metadata.items() if v},
+        "indexed_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def get_document_record(es, collection_name: str) -> Optional[Dict[str, Any]]:
+    """The stored document record of ``collection_name``, or None."""
+    try:
+        response = es.get(index=DOCUMENT_METADATA_INDEX, id=collection_name.lower())
+    except NotFoundError:
+        return None
+    return response["_source"]
+
+
+def replaced_revision(
+    previous: Optional[Dict[str, Any]], chat_id: str, file_hash: Optional[str]
+) -> Optional[str]:
+    """
+    File hash of the revision a new ingest replaces: the previous record's
+    file, if the same chat uploaded it and its content differs. Uploads from
+    other chats that happen to share the collection name replace nothing.
+    """
+    if not previous or not chat_id or previous.get("chat_id") != chat_id:
+        return None
+    previous_hash = previous.get("file_hash")
+    if not previous_hash or previous_hash == file_hash:
+        return None
+    return previous_hash
+
+
+def save_document_record(es, collection_name: str, record: Dict[str, Any]):
+    """
+    Store (or replace) the document record of ``collection_name``. Called
+    once the ingest has indexed every page, so readers never see a record
+    (file hash, page count) for pages that are not there yet.
+
+    Raises on failure: pages no longer carry the page count or file metadata,
+    so an ingest without its record would not be readable.
+    """
+    ensure_index(es, DOCUMENT_METADATA_INDEX, DOCUMENT_METADATA_MAPPINGS)
+    es.index(
+        index=DOCUMENT_METADATA_INDEX,
+        id=collection_name.lower(),
+        document={**record, "indexed_at": datetime.now(timezone.utc).isoformat()},
+    )
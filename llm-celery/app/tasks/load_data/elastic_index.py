@@ -0,0 +1,175 @@
+import os
+from typing import Any, Dict, Optional
+
+from celery.utils.log import get_task_logger
+from elasticsearch import BadRequestError, Elasticsearch
+
+logger = get_task_logger(__name__)
+
+# refresh_interval restored when ingest finishes; empty resets to the cluster default.
+ES_INGEST_REFRESH_INTERVAL = os.getenv("ES_INGEST_REFRESH_INTERVAL", "")
+# Indices with at most this many pages are merged to one segment after ingest.
+ES_FORCEMERGE_MAX_DOCS = int(os.getenv("ES_FORCEMERGE_MAX_DOCS", "20000"))
+ES_INDEX_SHARDS = int(os.getenv("ES_INDEX_SHARDS", "1"))
+# When set, every collection's pages go into this one index, routed by
+# collection name and read through a filtered alias named after the
+# collection, instead of one index per upload.
+ELASTIC_SHARED_INDEX = os.getenv("ELASTIC_SHARED_INDEX", "").lower()
+ES_SHARED_INDEX_SHARDS = int(os.getenv("ES_SHARED_INDEX_SHARDS", "3"))
+
+PAGE_INDEX_MAPPINGS: Dict[str, Any] = {
+    "dynamic_templates": [
+        {
+            # Nested per-page values are stored with the page, not indexed.
+            "metadata_objects": {
+                "path_match": "metadata.*",
+                "match_mapping_type": "object",
+                "mapping": {"type": "object", "enabled": False},
+            }
+        },
+        {
+            "metadata_strings": {
+                "path_match": "metadata.*",
+                "match_mapping_type": "string",
+                "mapping": {"type": "keyword", "ignore_above": 1024},
+            }
+        },
+    ],
+    "properties": {
+        "content": {"type": "text"},
+        "metadata": {
+            "properties": {
+                "page": {"type": "integer"},
+                "token_count": {"type": "integer"},
+                "file_hash": {"type": "keyword"},
+                "collection_name": {"type": "keyword"},
+            }
+        },
+    },
+}
+
+
+def ensure_index(
+    es: Elasticsearch,
+    index_name: str,
+    mappings: Dict[str, Any],
+    settings: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Create ``index_name`` with an explicit mapping; returns True if it was created."""
+    if es.indices.exists(index=index_name):
+        return False
+    try:
+        es.indices.create(index=index_name, mappings=mappings, settings=settings or {})
+        return True
+    except BadRequestError as e:
+        # Another worker created it first.
+        if e.error == "resource_already_exists_exception":
+            return False
+        raise
+
+
+def ensure_collection_alias(es: Elasticsearch, collection_name: str):
+    """
+    Point the alias ``collection_name`` at the shared index, filtered and
+    routed to that collection's pages, so reads and writes by collection
+    name work as they do against a dedicated index.
+    """
+    alias = collection_name.lower()
+    if es.indices.exists_alias(name=alias, index=ELASTIC_SHARED_INDEX):
+        return
+    es.indices.put_alias(
+        index=ELASTIC_SHARED_INDEX,
+        name=alias,
+        filter={"term": {"metadata.collection_name": alias}},
+        routing=alias,
+        is_write_index=True,
+    )
+
+
+def uses_shared_index(es: Elasticsearch, index_name: str) -> bool:
+    """False for collections that already have a dedicated index."""
+    if not ELASTIC_SHARED_INDEX:
+        return False
+    index_name = index_name.lower()
+    if es.indices.exists_alias(name=index_name):
+        return True
+    return not es.indices.exists(index=index_name)
+
+
+def prepare_page_index(es: Elasticsearch, index_name: str):
+    """
+    Create the page index with the page mapping (if new) and switch refresh
+    off until ``finish_page_index``. An existing index that already holds
+    pages keeps refreshing, since it is being searched.
+
+    With ELASTIC_SHARED_INDEX the shared index is created instead and the
+    collection gets its filtered alias; refresh is left alone because other
+    collections are searched and ingested there at the same time.
+    """
+    index_name = index_name.lower()
+    if uses_shared_index(es, index_name):
+        ensure_index(
+            es,
+            ELASTIC_SHARED_INDEX,
+            PAGE_INDEX_MAPPINGS,
+            {"number_of_shards": ES_SHARED_INDEX_SHARDS},
+        )
+        ensure_collection_alias(es, index_name)
+        logger.info(f"[Index] {index_name} routed to shared index {ELASTIC_SHARED_INDEX}")
+        return
+    created = ensure_index(
+        es,
+        index_name,
+        PAGE_INDEX_MAPPINGS,
+        {"number_of_shards": ES_INDEX_SHARDS, "refresh_interval": "-1"},
+    )
+    if not created:
+        if es.count(index=index_name)["count"]:
+            logger.info(f"[Index] {index_name} already has pages; refresh left on")
+            return
+        es.indices.put_settings(index=index_name, settings={"refresh_interval": "-1"})
+    logger.info(f"[Index] {index_name} ready for ingest (created={created}, refresh off)")
+
+
+def finish_page_index(es: Elasticsearch, index_name: str, force_merge: bool = True):
+    """
+    Restore refresh, make the ingested pages searchable and merge small
+    indices down to one segment. Call it once, after every batch of the
+    ingest has finished; ``force_merge`` only when they all succeeded.
+    """
+    index_name = index_name.lower()
+    try:
+        if uses_shared_index(es, index_name):
+            es.indices.refresh(index=index_name)
+            return
+        es.indices.put_settings(
+            index=index_name,
+            settings={"refresh_interval": ES_INGEST_REFRESH_INTERVAL or None},
+        )
+        es.indices.refresh(index=index_name)
+        if not force_merge:
+            return
+        docs = es.count(index=index_name)["count"]
+        if docs <= ES_FORCEMERGE_MAX_DOCS:
+            es.indices.forcemerge(
+                index=index_name, max_num_segments=1, wait_for_completion=False
+            )
+            logger.info(f"[Index] Force-merging {index_name} ({docs} pages)")
+    except Exception as e:
+        logger.error(f"[Index] Failed to finish ingest settings for {index_name}: {e}")
+
+
+def delete_revision_pages(es: Elasticsearch, index_name: str, file_hash: str) -> int:
+    """
+    Delete the pages of one revision (``metadata.file_hash``) of a file from
+    ``index_name``; returns the number of pages removed.
+    """
+    index_name = index_name.lower()
+    deleted = es.delete_by_query(
+        index=index_name,
+        query={"term": {"metadata.file_hash": file_hash}},
+        conflicts="proceed",
+        refresh=True,
+    )["deleted"]
+    logger.info(f"[Index] Removed {deleted} pages of revision {file_hash[:12]} from {index_name}")
+    return deleted
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+# Pages per embedding call.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Inference threads used by the embedding model.
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", str(os.cpu_count() or 1)))
+# On-disk embedding cache shared by every worker on the node; empty disables it.
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "/tmp/structgpt/embedding-cache")
+EMBED_CACHE_SIZE_MB = int(os.getenv("EMBED_CACHE_SIZE_MB", "2048"))
+
+_embedding_cache = None
+
+
+def get_embedding_cache():
+    """Process-local handle on the node-wide cache (diskcache is multi-process safe)."""
+    global _embedding_cache
+    if _embedding_cache is None and EMBED_CACHE_DIR:
+        from diskcache import Cache
+
+        _embedding_cache = Cache(
+            EMBED_CACHE_DIR,
+            size_limit=EMBED_CACHE_SIZE_MB * 1024 * 1024,
+            eviction_policy="least-recently-used",
+        )
+    return _embedding_cache
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedding_cache_key(model_name: str, text: str) -> str:
+    payload = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return "emb:" + hashlib.sha256(payload).hexdigest()
+
+
+def _model_name(embeddings) -> str:
+    return getattr(embeddings, "model_name", None) or type(embeddings).__name__
+
+
+def _embed_batch(embeddings, texts: List[str]) -> List[List[float]]:
+    if type(embeddings).__name__ == "GPT4AllEmbeddings":
+        # Embed4All takes a list and batches it natively; embed_documents would
+        # make one model call per text.
+        vectors = embeddings.client.embed(texts)
+        return [list(map(float, vector)) for vector in vectors]
+    return embeddings.embed_documents(texts)
+
+
+def _embed_uncached(
+    embeddings, texts: List[str], batch_size: int
+) -> List[List[float]]:
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(_embed_batch(embeddings, texts[i : i + batch_size]))
+    return vectors
+
+
+def embed_texts(
+    embeddings,
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    cache=None,
+) -> List[List[float]]:
+    """
+    Embed ``texts`` in batches of ``batch_size``; each text is embedded once.
+
+    Texts already in the embedding cache (same model, same normalized text)
+    never reach the model.
+    """
+    started = time.perf_counter()
+    cache = cache if cache is not None else get_embedding_cache()
+    model_name = _model_name(embeddings)
+
+    keys = [embedding_cache_key(model_name, text) for text in texts]
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    if cache is not None:
+        for i, key in enumerate(keys):
+            try:
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"[Embed] Cache read failed: {e}")
+                cached = None
+            if cached is not None:
+                vectors[i] = array("f", cached).tolist()
+
+    # Embed each distinct missing text once, even if it repeats in this batch.
+    missing = {}
+    for i, key in enumerate(keys):
+        if vectors[i] is None:
+            missing.setdefault(key, []).append(i)
+    missing_keys = list(missing)
+    fresh = _embed_uncached(
+        embeddings, [texts[missing[key][0]] for key in missing_keys], batch_size
+    )
+
+    for key, vector in zip(missing_keys, fresh):
+        for i in missing[key]:
+            vectors[i] = vector
+        if cache is not None:
+            try:
+                cache.set(key, array("f", vector).tobytes())
+            except Exception as e:
+                logger.warning(f"[Embed] Cache write failed: {e}")
+
+    elapsed = time.perf_counter() - started
+    cached_count = len(texts) - sum(len(indices) for indices in missing.values())
+    logger.info(
+        f"[Embed] {len(texts)} texts ({cached_count} cached) in {elapsed:.2f}s "
+        f"({len(texts) / elapsed if elapsed else 0:.1f} texts/s, batch_size={batch_size})"
+    )
+    return vectors
+
+
+def chroma_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the scalar, non-null values Chroma accepts as metadata."""
+    return {
+        k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))
+    }
+
+
+def upsert_documents_chroma(
+    collection, embeddings, records: List[Tuple[str, Dict[str, Any]]], ids: List[str]
+):
+    """Embed ``(text, metadata)`` page records once and upsert them with their vectors."""
+    texts = [text for text, _ in records]
+    vectors = embed_texts(embeddings, texts)
+    collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=texts,
+        metadatas=[chroma_metadata(metadata) for _, metadata in records],
+    )
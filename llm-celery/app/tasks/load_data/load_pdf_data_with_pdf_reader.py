@@ -1,29 +1,46 @@
-from urllib.parse import urlparse
 import re
 import os
 import pymupdf
 import hashlib
 import asyncio
-import boto3
-import chromadb
-import subprocess
-import re
-from chromadb.config import Settings
 import time
-from app.tasks.load_data.cache import get_stop_flag, publish_stream_event, set_stop_flag
-
-
+from app.tasks.load_data.bulk_indexer import bulk_index
+from app.tasks.load_data.elastic_index import (
+    ELASTIC_SHARED_INDEX,
+    delete_revision_pages,
+    finish_page_index,
+    prepare_page_index,
+)
+from app.tasks.load_data.embedding_pipeline import upsert_documents_chroma
+from app.tasks.load_data.clients import (
+    get_chroma_client,
+    get_elastic_client,
+    get_embeddings,
+)
+from app.tasks.load_data.page_cache import build_header_info
+from app.tasks.load_data.batch_format import iter_page_records
+from app.tasks.load_data.page_store import resolve_page_batch
+from app.tasks.load_data.page_ids import file_sha256, page_document_id
+from app.tasks.load_data.pdf_probe import probe_pdf
+from app.tasks.load_data.document_metadata import (
+    document_record,
+    get_document_record,
+    replaced_revision,
+    save_document_record,
+)
+from app.tasks.load_data.cache import get_stop_flag, publish_stream_event, set_stop_flag, set_task_id
+from app.tasks.load_data.cache import get_ingested_collection, register_ingested_file
+from app.tasks.load_data.cache import unregister_ingested_file
+from app.tasks.load_data.cache import pop_pending_document_record, set_pending_document_record
+from app.tasks.load_data.cache import abort_ingest, record_ingest_batch
+from app.tasks.load_data.cache import flush_stream_events
+
+
+from celery import chord, group
+from celery.signals import task_postrun
 from celery.utils.log import get_task_logger
-from elasticsearch import Elasticsearch, helpers
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from uuid import uuid4
 
 from langchain_core.documents import Document
-from llama_index.embeddings.langchain import LangchainEmbedding
-from langchain_community.embeddings import GPT4AllEmbeddings
-
-
-from llama_parse import LlamaParse
 
 from dotenv import load_dotenv
 from app.config.celery_app import celery_app
@@ -33,9 +50,7 @@ import nest_asyncio
 nest_asyncio.apply()
 #  uncomment when run local
 from app.tasks.load_data.PyMuPDFReader import PDFMarkdownReader
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from celery.exceptions import WorkerLostError
 
 load_dotenv()
 
@@ -47,16 +62,22 @@ logger = get_task_logger(__name__)
 current_file_dir = os.path.dirname(os.path.abspath(__file__))
 
 
-# Local
-model_name = "all-MiniLM-L6-v2.gguf2.f16.gguf"
-gpt4all_kwargs = {"allow_download": "True"}
-embeddings = GPT4AllEmbeddings(model_name=model_name, gpt4all_kwargs=gpt4all_kwargs)
-wrapped_embeddings = LangchainEmbedding(embeddings)
+# The embedding model and the Elasticsearch/Chroma clients are created
+# lazily per worker process (see clients.py) instead of at import.
+
+# Uploads with at least this many pages are split into page ranges and parsed
+# by many workers through a chord; 0 keeps single-worker parsing.
+PARSE_FANOUT_MIN_PAGES = int(os.getenv("PARSE_FANOUT_MIN_PAGES", "0"))
+# One Chroma collection for every upload, filtered by collection_name metadata.
+CHROMA_SHARED_COLLECTION = os.getenv("CHROMA_SHARED_COLLECTION", "")
+PARSE_RANGE_PAGES = int(os.getenv("PARSE_RANGE_PAGES", "200"))
 
 
-ELASTIC_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
-es = Elasticsearch([ELASTIC_HOST])
 
+@task_postrun.connect
+def flush_task_events(**kwargs):
+    # Progress events are batched; make sure none outlive the task unsent.
+    flush_stream_events()
 
 
 # @celery_app.task(name="process_uploaded_file")
@@ -119,14 +140,14 @@ def sanitize_name(name):
 
 
 @celery_app.task(name="process_uploaded_file")
-def process_uploaded_file(file_path: str, chat_id: str):
+def process_uploaded_file(file_path: str, chat_id: str, file_hash: str = None):
     try:
         # Create a unique folder for this chat
 
         # Start async processing inside this thread (Celery worker)
         import nest_asyncio
         nest_asyncio.apply()
-        asyncio.run(process_pdf_and_send_updates(file_path, chat_id))
+        asyncio.run(process_pdf_and_send_updates(file_path, chat_id, file_hash))
 
     except Exception as e:
         print(f"❌ Celery Task Error: {str(e)}")
@@ -144,45 +165,69 @@ def process_uploaded_file(file_path: str, chat_id: str):
 
 
 def is_valid_pdf(file_path: str) -> bool:
-    try:
-        doc = pymupdf.open(file_path)
-        _ = doc.page_count  # Trigger full load
-        return True
-    except Exception as e:
-        print(f"[PyMuPDF Check] Invalid PDF: {e}")
-        return False
-
+    return probe_pdf(file_path).valid
 
-def is_valid_pdf_pdfinfo(file_path: str, timeout: int = 5) -> bool:
-    try:
-        output = subprocess.check_output(["pdfinfo", file_path], text=True, timeout=timeout)
-        return bool(re.search(r"Pages:\s+\d+", output))
-    except subprocess.TimeoutExpired:
-        print(f"[pdfinfo Timeout] Took too long.")
-        return False
-    except Exception as e:
-        print(f"[pdfinfo Error] {e}")
-        return False
 
-def is_pdf_valid(file_path: str) -> bool:
-    return is_valid_pdf(file_path) or is_valid_pdf_pdfinfo(file_path)
 
-
-
-async def process_pdf_and_send_updates(file_path: str, chat_id: str):
+async def process_pdf_and_send_updates(file_path: str, chat_id: str, file_hash: str = None):
     reader = PDFMarkdownReader()
     collection_name = sanitize_collection_name(Path(file_path).name)
+    file_hash = file_hash or file_sha256(file_path)
+
+    existing_collection = get_ingested_collection(file_hash)
+    if existing_collection:
+        # Same bytes already indexed: attach this chat to that collection.
+        publish_stream_event(
+            chat_id,
+            {
+                "message": "File already indexed; reusing existing collection.",
+                "type": "task_complete",
+                "chat_id": chat_id,
+                "collections": [existing_collection],
+                "isFinished": True,
+            },
+        )
+        cleanup_upload_folder(file_path)
+        return
    
-    if not is_valid_pdf_pdfinfo(file_path):
+    # One open validates the file and captures everything parsing needs.
+    profile = probe_pdf(file_path, file_hash)
+    if not profile.valid:
         publish_stream_event(
             chat_id,
             {
                 "type": "error",
-                "message": f"PDF appears to be corrupt or unreadable.",
+                "message": f"PDF appears to be corrupt or unreadable: {profile.error}",
                 "isFinished": False,
             },
         )
         return
+    print("[PDF Probe]", profile.summary())
+    if not profile.has_text_layer:
+        print(f"⚠️ No text layer found in sampled pages of {file_path}")
+
+    # Written to Elasticsearch once every page is indexed (see store_document_record).
+    set_pending_document_record(
+        collection_name, chat_id, document_record(collection_name, profile, chat_id)
+    )
+    prepare_page_index(get_elastic_client(), collection_name)
+
+    total_pages = profile.page_count
+    if PARSE_FANOUT_MIN_PAGES and total_pages >= PARSE_FANOUT_MIN_PAGES:
+        # The chord callback owns cleanup of the upload folder from here on.
+        try:
+            dispatch_page_ranges(
+                file_path,
+                collection_name,
+                chat_id,
+                total_pages,
+                file_hash,
+                hdr_info=profile.header_stats.levels(),
+            )
+        except Exception:
+            finish_page_index(get_elastic_client(), collection_name, force_merge=False)
+            raise
+        return
 
     def redis_stream_emitter(chat_id, msg: dict):
         try:
@@ -202,8 +247,10 @@ async def process_pdf_and_send_updates(file_path: str, chat_id: str):
         await reader.load_data(
             file_path=Path(file_path),
             collection_name=collection_name,
+            extra_info={"file_hash": file_hash},
             chat_id=chat_id,
             message_handler=redis_stream_emitter,
+            profile=profile,
         )
 
         if get_stop_flag(chat_id):
@@ -232,14 +279,307 @@ async def process_pdf_and_send_updates(file_path: str, chat_id: str):
         )
 
     finally:
-        # Cleanup: delete from S3 and local filesystem
+        if not reader.total_batches:
+            # Nothing was sent for indexing.
+            finish_page_index(get_elastic_client(), collection_name, force_merge=False)
+        elif reader.dispatched_batches < reader.total_batches:
+            # The batches never sent will not report back; the ingest ends
+            # (unregistered) once the ones that were sent have finished, and
+            # whoever sees that restores the index settings.
+            try:
+                if abort_ingest(collection_name, chat_id, reader.dispatched_batches) is not None:
+                    finish_page_index(get_elastic_client(), collection_name, force_merge=False)
+            except Exception as e:
+                print(f"⚠️ Failed to close ingest of {collection_name}: {e}")
+        cleanup_upload_folder(file_path)
+
+
+def cleanup_upload_folder(file_path: str):
+    # Cleanup: delete from S3 and local filesystem
+    try:
+        folder_path = Path(file_path).parent
+        if folder_path.exists():
+            shutil.rmtree(folder_path)
+            print(f"🧹 Deleted local folder: {folder_path}")
+    except Exception as e:
+        print(f"⚠️ Failed to delete local folder: {e}")
+
+
+def dispatch_page_ranges(
+    file_path: str,
+    collection_name: str,
+    chat_id: str,
+    total_pages: int,
+    file_hash: str,
+    range_size: int = PARSE_RANGE_PAGES,
+    hdr_info=None,
+):
+    """
+    Split an upload into page ranges and parse them on many workers.
+
+    Every range is parsed and indexed by its own ``parse_page_range`` task;
+    ``finalize_page_ranges`` runs once all of them have finished and sends the
+    single completion event. The upload folder must be on storage shared by
+    the workers.
+    """
+    if hdr_info is None:
+        with pymupdf.open(file_path) as pdf:
+            hdr_info = build_header_info(pdf, file_hash)
+    extra_info = {"file_hash": file_hash}
+    ranges = [
+        (start, min(start + range_size, total_pages))
+        for start in range(0, total_pages, range_size)
+    ]
+
+    header = group(
+        parse_page_range.s(
+            str(file_path),
+            collection_name,
+            chat_id,
+            start,
+            stop,
+            hdr_info,
+            range_number,
+            len(ranges),
+            extra_info,
+        )
+        for range_number, (start, stop) in enumerate(ranges, start=1)
+    )
+    result = chord(header)(
+        finalize_page_ranges.s(str(file_path), collection_name, chat_id, file_hash)
+    )
+
+    for range_result in result.parent.results:
+        set_task_id(chat_id, range_result.id)
+    set_task_id(chat_id, result.id)
+
+    publish_stream_event(
+        chat_id,
+        {
+            "message": f"File split into {len(ranges)} page ranges across workers.",
+            "type": "start",
+            "chat_id": chat_id,
+            "collection": collection_name,
+            "isFinished": False,
+        },
+    )
+
+
+@celery_app.task(name="parse_page_range")
+def parse_page_range(
+    file_path: str,
+    collection_name: str,
+    chat_id: str,
+    start: int,
+    stop: int,
+    hdr_info,
+    range_number: int,
+    total_ranges: int,
+    extra_info=None,
+):
+    """Parse pages ``start``..``stop`` of an upload and index them."""
+    if get_stop_flag(chat_id):
+        return {"range": range_number, "pages": 0, "ok": True}
+
+    try:
+        reader = PDFMarkdownReader()
+        documents = reader.load_page_range(
+            file_path, range(start, stop), chat_id, hdr_info, extra_info
+        )
+        failed = 0
+        if documents:
+            failed = index_documents_elastic(documents, collection_name)["failed"]
+        if failed:
+            raise RuntimeError(f"{failed} pages were rejected by Elasticsearch")
+
+        publish_stream_event(
+            chat_id,
+            {
+                "message": f"Range {range_number}/{total_ranges} (pages {start + 1}-{stop}) parsed and indexed.",
+                "type": "processing_done",
+                "chat_id": chat_id,
+                "collection": collection_name,
+                "isFinished": False,
+            },
+        )
+        return {"range": range_number, "pages": len(documents), "ok": True}
+
+    except Exception as e:
+        logger.error(f"Error parsing range {range_number}/{total_ranges}: {e}")
+        publish_stream_event(
+            chat_id,
+            {
+                "error": True,
+                "message": f"Failed to parse pages {start + 1}-{stop}: {str(e)}",
+                "type": "error",
+                "chat_id": chat_id,
+                "isFinished": False,
+            },
+        )
+        return {"range": range_number, "pages": 0, "ok": False, "error": str(e)}
+
+
+@celery_app.task(name="finalize_page_ranges")
+def finalize_page_ranges(
+    results, file_path: str, collection_name: str, chat_id: str, file_hash: str = None
+):
+    """Chord callback: send one completion event once every range is done."""
+    index_name = collection_name.lower()
+    failed = [r for r in results if not r or not r.get("ok")]
+    record_error = None
+    replaced_hash = None
+
+    try:
         try:
-            folder_path = Path(file_path).parent
-            if folder_path.exists():
-                shutil.rmtree(folder_path)
-                print(f"🧹 Deleted local folder: {folder_path}")
+            replaced_hash = store_document_record(
+                index_name, chat_id, not failed and not get_stop_flag(chat_id)
+            )
         except Exception as e:
-            print(f"⚠️ Failed to delete local folder: {e}")
+            logger.error(f"Failed to store the document record of '{index_name}': {e}")
+            record_error = str(e)
+        finish_page_index(
+            get_elastic_client(),
+            index_name,
+            force_merge=not failed and not record_error and not get_stop_flag(chat_id),
+        )
+        if get_stop_flag(chat_id):
+            publish_stream_event(
+                chat_id,
+                {
+                    "message": "✅ Stop requested. Task terminated early.",
+                    "type": "stop",
+                    "chat_id": chat_id,
+                    "collections": [index_name],
+                    "isFinished": False,
+                },
+            )
+        elif failed or record_error:
+            publish_stream_event(
+                chat_id,
+                {
+                    "error": True,
+                    "message": (
+                        f"Indexing failed for {len(failed)} of {len(results)} page ranges."
+                        if failed
+                        else f"Failed to store the document record: {record_error}"
+                    ),
+                    "type": "error",
+                    "chat_id": chat_id,
+                    "collections": [index_name],
+                    "isFinished": True,
+                },
+            )
+        else:
+            if replaced_hash:
+                try:
+                    remove_replaced_revision(index_name, replaced_hash)
+                except Exception as e:
+                    logger.error(f"Failed to remove the earlier revision from '{index_name}': {e}")
+            if file_hash:
+                register_ingested_file(file_hash, index_name)
+            publish_stream_event(
+                chat_id,
+                {
+                    "message": "All tasks completed successfully.",
+                    "type": "task_complete",
+                    "chat_id": chat_id,
+                    "collections": [index_name],
+                    "isFinished": True,
+                },
+            )
+    finally:
+        cleanup_upload_folder(file_path)
+
+
+def remove_replaced_revision(index_name: str, replaced_hash: str):
+    """
+    Drop the pages of the revision a re-upload replaced from its index and
+    forget its fingerprint, which no longer matches the collection.
+    """
+    delete_revision_pages(get_elastic_client(), index_name, replaced_hash)
+    unregister_ingested_file(replaced_hash, index_name.lower())
+
+
+def store_document_record(collection_name: str, chat_id: str, completed: bool):
+    """
+    Write (on success) or drop the document record held for this ingest.
+    Returns the file hash of the revision the new record replaces, if any
+    (see ``replaced_revision``). Raises if the record cannot be written.
+    """
+    record = pop_pending_document_record(collection_name, chat_id)
+    if not completed or record is None:
+        return None
+    es = get_elastic_client()
+    previous = get_document_record(es, collection_name)
+    save_document_record(es, collection_name, record)
+    return replaced_revision(previous, chat_id, record.get("file_hash"))
+
+
+def complete_ingest_batch(
+    collection_name: str,
+    chat_id: str,
+    batch_number: int,
+    ok: bool,
+    file_hash: str = None,
+    finish_index: bool = False,
+    on_complete=None,
+):
+    """
+    Record a finished batch. Whichever batch finishes last (in any order)
+    writes the document record, runs ``on_complete`` with the file hash of
+    the revision it replaced (if any) and registers the file if every batch
+    was indexed,
+    restores the Elasticsearch index settings when ``finish_index``, and
+    sends the final event.
+    """
+    try:
+        completed = record_ingest_batch(collection_name, chat_id, batch_number, ok)
+    except Exception as e:
+        logger.error(f"Failed to record batch {batch_number} of '{collection_name}': {e}")
+        return
+    if completed is None:
+        return
+    replaced_hash = None
+    try:
+        replaced_hash = store_document_record(collection_name, chat_id, completed)
+    except Exception as e:
+        logger.error(f"Failed to store the document record of '{collection_name}': {e}")
+        completed = False
+    if completed and replaced_hash and on_complete is not None:
+        try:
+            on_complete(replaced_hash)
+        except Exception as e:
+            logger.error(f"Failed to finish ingest of '{collection_name}': {e}")
+    if finish_index:
+        finish_page_index(get_elastic_client(), collection_name, force_merge=completed)
+    if get_stop_flag(chat_id):
+        return
+
+    if completed:
+        if file_hash:
+            register_ingested_file(file_hash, collection_name)
+        publish_stream_event(
+            chat_id,
+            {
+                "message": "All tasks completed successfully.",
+                "type": "task_complete",
+                "chat_id": chat_id,
+                "collections": [collection_name],
+                "isFinished": True,
+            },
+        )
+    else:
+        publish_stream_event(
+            chat_id,
+            {
+                "error": True,
+                "message": "Indexing failed for some batches; the file was not fully indexed.",
+                "type": "error",
+                "chat_id": chat_id,
+                "collections": [collection_name],
+                "isFinished": True,
+            },
+        )
 
 
 @celery_app.task(name="load_with_fitz_chroma", bind=True)
@@ -270,7 +610,9 @@ def load_with_fitz_chroma(
             # logger.info(f"Type of documents[0]: {type(documents[0])}")
             if get_stop_flag(chat_id):
                 # delete_stop_flag(chat_id)
+                complete_ingest_batch(collection_name, chat_id, current_batch_number, False)
                 return []
+            documents = resolve_page_batch(documents)
             # time.sleep(300)
     
             # WebSocket: Notify batch processing start
@@ -304,12 +646,6 @@ def load_with_fitz_chroma(
             # document_list = list(
             #     filter(None, processed_documents)
             # )  # Remove None values
-            for i, doc in enumerate(documents):
-                # logger.info("doc  : ",str(doc))
-                embedding = embeddings.embed_documents([doc.page_content])
-                logger.info(f"Test embedding length: {len(embedding)}")
-                logger.info(f"Embedding preview: {embedding[:1]}")
-                # assert isinstance(doc, Document), f"❌ Item {i} is not a Document: {type(doc)}"
             # If no valid documents found, notify and exit
             if not documents:
 
@@ -324,6 +660,7 @@ def load_with_fitz_chroma(
                     },
                 )
                 logger.error("No valid content found in documents.")
+                complete_ingest_batch(collection_name, chat_id, current_batch_number, False)
                 return False
 
             # WebSocket: Notify conversion completion
@@ -351,28 +688,31 @@ def load_with_fitz_chroma(
                 if not chroma_host:
                     raise ValueError("CHROMA_HOST is not set!")
 
-                db = chromadb.HttpClient(
-                    host=chroma_host,  # "chroma-server.monitoring.svc.cluster.local",
-                    port=8000,
-                    # settings=Settings(
-                    #     chroma_client_auth_provider="chromadb.auth.basic_authn.BasicAuthClientProvider",
-                    #     chroma_client_auth_credentials=chroma_credentials,
-                    # ),
-                )
-                from langchain_chroma import Chroma
-
-                              # Insert into Chroma directly
-                chroma_vectorstore = Chroma(
-                    collection_name=collection_name,
-                    embedding_function=embeddings,
-                    client=db,
+                # "chroma-server.monitoring.svc.cluster.local"
+                db = get_chroma_client(chroma_host, 8000)
+                collection = db.get_or_create_collection(
+                    CHROMA_SHARED_COLLECTION or collection_name
                 )
 
-                from uuid import uuid4
-
-                uuids = [str(uuid4()) for _ in range(len(documents))]
-
-                chroma_vectorstore.add_documents(documents=documents, ids=uuids)
+                records = list(iter_page_records(documents))
+                if CHROMA_SHARED_COLLECTION:
+                    # Readers select this collection's pages with a where filter.
+                    records = [
+                        (text, {**metadata, "collection_name": collection_name})
+                        for text, metadata in records
+                    ]
+                ids = [
+                    page_document_id(
+                        collection_name,
+                        metadata.get("file_hash", ""),
+                        metadata.get("page"),
+                    )
+                    for _, metadata in records
+                ]
+
+                # Each page is embedded once and upserted with its vector, so a
+                # re-run batch replaces its own pages.
+                upsert_documents_chroma(collection, get_embeddings(), records, ids)
                 # chroma_vectorstore.add_documents(document_list)
                 # WebSocket: Notify indexing completion
 
@@ -403,21 +743,26 @@ def load_with_fitz_chroma(
                         "isFinished": current_batch_number == total_batches,
                     },
                 )
+                complete_ingest_batch(collection_name, chat_id, current_batch_number, False)
                 return False
 
             # === 🔹 Final Notifications ===
-            if current_batch_number == total_batches:
+            file_hash = next(iter_page_records(documents))[1].get("file_hash")
 
-                publish_stream_event(
-                    chat_id,
-                    {
-                        "message": "All tasks completed successfully.",
-                        "type": "task_complete",
-                        "chat_id": chat_id,
-                        "collections": [collection_name],
-                        "isFinished": current_batch_number == total_batches,
-                    },
-                )
+            def delete_revision(replaced_hash):
+                where = {"file_hash": replaced_hash}
+                if CHROMA_SHARED_COLLECTION:
+                    where = {"$and": [{"collection_name": collection_name}, where]}
+                collection.delete(where=where)
+
+            complete_ingest_batch(
+                collection_name,
+                chat_id,
+                current_batch_number,
+                True,
+                file_hash,
+                on_complete=delete_revision,
+            )
             return True
 
         except Exception as e:
@@ -434,6 +779,7 @@ def load_with_fitz_chroma(
                     "isFinished": current_batch_number == total_batches,
                 },
             )
+            complete_ingest_batch(collection_name, chat_id, current_batch_number, False)
 
             return False
 
@@ -468,6 +814,37 @@ def load_with_fitz_chroma(
 
     return run_async(fallback_main())
 
+def index_documents_elastic(documents, index_name):
+    """
+    Bulk-index parsed pages (a ``PageBatch`` or a list of documents) into the
+    Elasticsearch index ``index_name``.
+    """
+
+    index_name = index_name.lower()
+
+    def sanitize_metadata(meta: dict) -> dict:
+        meta = {k: v for k, v in meta.items() if v is not None}
+        if ELASTIC_SHARED_INDEX:
+            # Matched by the collection's alias filter in the shared index.
+            meta["collection_name"] = index_name
+        return meta
+    actions = [
+        {
+            "_op_type": "index",
+            "_index": index_name,
+            "_id": page_document_id(
+                index_name, metadata.get("file_hash", ""), metadata.get("page")
+            ),
+            "_source": {
+                "content": text,
+                "metadata": sanitize_metadata(metadata),
+            },
+        }
+        for text, metadata in iter_page_records(documents)
+    ]
+    return bulk_index(get_elastic_client(), actions)
+
+
 @celery_app.task(name="load_with_fitz_elastic", bind=True)
 def load_with_fitz_elastic(
     self,
@@ -486,7 +863,11 @@ def load_with_fitz_elastic(
             )
 
             if get_stop_flag(chat_id):
+                complete_ingest_batch(
+                    index_name, chat_id, current_batch_number, False, finish_index=True
+                )
                 return []
+            documents = resolve_page_batch(documents)
 
             publish_stream_event(
                 chat_id,
@@ -510,6 +891,9 @@ def load_with_fitz_elastic(
                     },
                 )
                 logger.error("No valid content found in documents.")
+                complete_ingest_batch(
+                    index_name, chat_id, current_batch_number, False, finish_index=True
+                )
                 return False
 
             publish_stream_event(
@@ -522,36 +906,8 @@ def load_with_fitz_elastic(
                 },
             )
 
-            # Prepare Elastic bulk indexing
-            actions = []
-            def sanitize_metadata(meta: dict) -> dict:
-                return {k: v for k, v in meta.items() if v is not None}
-
-            for doc in documents:
-                uid = str(uuid4())
-                metadata = sanitize_metadata(doc.metadata)
-                text = doc.page_content
-                # logger.info("doc : ",str(doc.metadata))
-                # logger.info("type : ",type(doc))
-                index_name = index_name.lower()
-
-                action = {
-                    "_index": index_name,
-                    "_id": uid,
-                    "_source": {
-                        "content": text,
-                        "metadata": metadata,
-                    },
-                }
-                # logger.info("action : ",json.dumps(action))
-                actions.append(action)
-                from elasticsearch.helpers import streaming_bulk
-                print("actions : ",len(actions) )
-                for ok, item in streaming_bulk(es, actions, raise_on_error=False):
-                    if not ok:
-                        print("❌ Failed to index document:", item)
-
-            # helpers.bulk(es, actions)
+            summary = index_documents_elastic(documents, index_name)
+            index_name = index_name.lower()
 
             publish_stream_event(
                 chat_id,
@@ -559,22 +915,26 @@ def load_with_fitz_elastic(
                     "message": f"Batch {current_batch_number}/{total_batches} Index Complete.",
                     "type": "processing_done",
                     "chat_id": chat_id,
+                    "indexed": summary["indexed"],
+                    "failed": summary["failed"],
+                    "docs_per_sec": summary["docs_per_sec"],
                     "isFinished": False,
                 },
             )
             logger.info("Elastic indexing complete.")
+            file_hash = next(iter_page_records(documents))[1].get("file_hash")
 
-            if current_batch_number == total_batches:
-                publish_stream_event(
-                    chat_id,
-                    {
-                        "message": "All tasks completed successfully.",
-                        "type": "task_complete",
-                        "chat_id": chat_id,
-                        "collections": [index_name],
-                        "isFinished": True,
-                    },
-                )
+            complete_ingest_batch(
+                index_name,
+                chat_id,
+                current_batch_number,
+                not summary["failed"],
+                file_hash,
+                finish_index=True,
+                on_complete=lambda replaced_hash: remove_replaced_revision(
+                    index_name, replaced_hash
+                ),
+            )
             return True
 
         except Exception as e:
@@ -589,6 +949,9 @@ def load_with_fitz_elastic(
                     "isFinished": current_batch_number == total_batches,
                 },
             )
+            complete_ingest_batch(
+                index_name, chat_id, current_batch_number, False, finish_index=True
+            )
             return False
 
     async def fallback_main():
@@ -0,0 +1,230 @@
+import hashlib
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import pymupdf
+from pymupdf4llm import IdentifyHeaders
+
+# Node-wide cache of rendered pages keyed by page content; empty disables it.
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "/tmp/structgpt/page-cache")
+PAGE_CACHE_SIZE_MB = int(os.getenv("PAGE_CACHE_SIZE_MB", "4096"))
+# Documents longer than this get header levels from a stratified page sample
+# that is refined as pages are rendered; 0 always scans every page.
+HEADER_SAMPLE_PAGES = int(os.getenv("HEADER_SAMPLE_PAGES", "64"))
+
+_page_cache = None
+
+
+def get_page_cache():
+    """Process-local handle on the node-wide page cache."""
+    global _page_cache
+    if _page_cache is None and PAGE_CACHE_DIR:
+        from diskcache import Cache
+
+        _page_cache = Cache(
+            PAGE_CACHE_DIR,
+            size_limit=PAGE_CACHE_SIZE_MB * 1024 * 1024,
+            eviction_policy="least-recently-used",
+        )
+    return _page_cache
+
+
+def cache_get(key: Optional[str]):
+    cache = get_page_cache()
+    if cache is None or not key:
+        return None
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"[Page Cache] Read failed: {e}")
+        return None
+
+
+def cache_set(key: Optional[str], value):
+    cache = get_page_cache()
+    if cache is None or not key:
+        return
+    try:
+        cache.set(key, value)
+    except Exception as e:
+        print(f"[Page Cache] Write failed: {e}")
+
+
+def page_content_key(page: pymupdf.Page) -> str:
+    """
+    Hash of what a page draws: its content stream, the form XObjects it
+    invokes, its fonts and images (by description, not xref number, so the
+    same page in a re-saved file hashes the same) and its geometry.
+    """
+    doc = page.parent
+    digest = hashlib.sha256()
+    digest.update(page.read_contents() or b"")
+    for xref, name, _invoker, _bbox in page.get_xobjects():
+        digest.update(name.encode())
+        digest.update(doc.xref_stream(xref) or b"")
+    for font in page.get_fonts():
+        digest.update(repr(font[1:]).encode())
+    for image in page.get_images():
+        digest.update(repr(image[2:]).encode())
+    digest.update(f"{tuple(page.rect)}:{page.rotation}".encode())
+    return digest.hexdigest()
+
+
+def page_text_blocks(page: pymupdf.Page) -> List[dict]:
+    return page.get_text("dict", flags=pymupdf.TEXTFLAGS_TEXT)["blocks"]
+
+
+def font_stats_from_blocks(blocks: List[dict]) -> Dict[int, int]:
+    """Characters per rounded font size, as counted by ``IdentifyHeaders``."""
+    fontsizes = defaultdict(int)
+    for block in blocks:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                text = span["text"].strip()
+                if text:
+                    fontsizes[round(span["size"])] += len(text)
+    return dict(fontsizes)
+
+
+def page_font_stats(page: pymupdf.Page) -> Dict[int, int]:
+    return font_stats_from_blocks(page_text_blocks(page))
+
+
+class HeaderLevels(IdentifyHeaders):
+    """
+    ``IdentifyHeaders`` built from precomputed font-size statistics instead of
+    a scan of the whole document.
+    """
+
+    def __init__(self, fontsizes: Dict[int, int], body_limit: float = 12):
+        self.fontsizes = dict(fontsizes)
+        self.header_id = {}
+
+        # The most frequent font size is body text; bigger sizes are headers.
+        temp = sorted(self.fontsizes.items(), key=lambda i: i[1], reverse=True)
+        self.body_limit = min(body_limit, temp[0][0]) if temp else body_limit
+
+        sizes = sorted(
+            [f for f in self.fontsizes if f > self.body_limit], reverse=True
+        )[:6]
+        for i, size in enumerate(sizes):
+            self.header_id[size] = "#" * (i + 1) + " "
+
+    def get_header_id(self, span: dict, page=None) -> str:
+        return self.header_id.get(round(span["size"]), "")
+
+
+def header_signature(hdr_info: IdentifyHeaders) -> str:
+    """Short digest of the header levels a page was rendered with."""
+    levels = sorted(getattr(hdr_info, "header_id", {}).items())
+    return hashlib.sha256(repr(levels).encode()).hexdigest()[:16]
+
+
+def markdown_cache_key(page: pymupdf.Page, hdr_info: IdentifyHeaders) -> Optional[str]:
+    if get_page_cache() is None:
+        return None
+    return f"md:{page_content_key(page)}:{header_signature(hdr_info)}"
+
+
+def _cached_page_font_stats(page: pymupdf.Page) -> Dict[int, int]:
+    if get_page_cache() is None:
+        return page_font_stats(page)
+    key = f"fonts:{page_content_key(page)}"
+    stats = cache_get(key)
+    if stats is None:
+        stats = page_font_stats(page)
+        cache_set(key, stats)
+    return stats
+
+
+def sample_pages(page_count: int, sample_size: int) -> List[int]:
+    """One page from the middle of each of ``sample_size`` equal strata."""
+    if sample_size <= 0 or page_count <= sample_size:
+        return list(range(page_count))
+    stride = page_count / sample_size
+    return sorted({int(i * stride + stride / 2) for i in range(sample_size)})
+
+
+class HeaderStats:
+    """
+    Per-page font-size statistics for one document, from which header levels
+    are derived. Starts from a page sample and grows as pages are rendered;
+    ``complete`` once every page has been counted.
+    """
+
+    def __init__(self, page_count: int, file_hash: Optional[str] = None):
+        self.page_count = page_count
+        self.file_hash = file_hash
+        self.pages: Dict[int, Dict[int, int]] = {}
+        self.complete = False
+        self._levels: Optional[HeaderLevels] = None
+
+    def add(self, page_number: int, fontsizes: Dict[int, int]):
+        if self.complete or page_number in self.pages:
+            return
+        self.pages[page_number] = fontsizes
+        self._levels = None
+        if len(self.pages) >= self.page_count:
+            self.complete = True
+            self.save()
+
+    def add_many(self, stats: Iterable):
+        for page_number, fontsizes in stats:
+            if fontsizes is not None:
+                self.add(page_number, fontsizes)
+
+    def totals(self) -> Dict[int, int]:
+        fontsizes = defaultdict(int)
+        for stats in self.pages.values():
+            for size, count in stats.items():
+                fontsizes[size] += count
+        return dict(fontsizes)
+
+    def levels(self) -> HeaderLevels:
+        if self._levels is None:
+            self._levels = HeaderLevels(self.totals())
+        return self._levels
+
+    def save(self):
+        """Cache the totals of a complete scan under the file fingerprint."""
+        if self.complete and self.file_hash:
+            cache_set(f"hdrstats:{self.file_hash}", self.totals())
+
+    @classmethod
+    def load(cls, page_count: int, file_hash: Optional[str]) -> Optional["HeaderStats"]:
+        totals = cache_get(f"hdrstats:{file_hash}") if file_hash else None
+        if totals is None:
+            return None
+        stats = cls(page_count, file_hash)
+        stats.complete = True
+        stats._levels = HeaderLevels(totals)
+        return stats
+
+
+def build_header_stats(
+    doc: pymupdf.Document,
+    file_hash: Optional[str] = None,
+    sample_size: int = HEADER_SAMPLE_PAGES,
+) -> HeaderStats:
+    """
+    Font statistics for ``doc``: the cached full-document totals for a file
+    seen before, otherwise a stratified sample of ``sample_size`` pages (every
+    page for short documents). Per-page statistics come from the page cache
+    when the page content was scanned before.
+    """
+    cached = HeaderStats.load(doc.page_count, file_hash)
+    if cached is not None:
+        return cached
+
+    stats = HeaderStats(doc.page_count, file_hash)
+    for page_number in sample_pages(doc.page_count, sample_size):
+        stats.add(page_number, _cached_page_font_stats(doc[page_number]))
+    return stats
+
+
+def build_header_info(
+    doc: pymupdf.Document, file_hash: Optional[str] = None
+) -> IdentifyHeaders:
+    """Header levels for ``doc`` estimated by ``build_header_stats``."""
+    return build_header_stats(doc, file_hash).levels()
@@ -0,0 +1,25 @@
+import hashlib
+import uuid
+from pathlib import Path
+from typing import Union
+
+
+def file_sha256(file_path: Union[str, Path], block_size: int = 1024 * 1024) -> str:
+    """Hex SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_document_id(collection_name: str, file_hash: str, page_number: int) -> str:
+    """
+    Deterministic ID of one page of one file in one collection.
+
+    Re-indexing the same page always targets the same ID, so retried or
+    duplicated batches overwrite instead of adding copies. Keep in sync with
+    llm-backend/app/src/utils/page_ids.py.
+    """
+    key = f"{collection_name.lower()}/{file_hash}/{page_number}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
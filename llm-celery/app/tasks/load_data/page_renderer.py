@@ -0,0 +1,353 @@
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pymupdf
+from pymupdf4llm import IdentifyHeaders, to_markdown
+
+from app.tasks.load_data.cache import get_stop_flag
+from app.tasks.load_data.page_cache import (
+    cache_get,
+    cache_set,
+    font_stats_from_blocks,
+    markdown_cache_key,
+    page_text_blocks,
+)
+
+# "thread" keeps the original in-process ThreadPoolExecutor rendering,
+# "process" renders contiguous page ranges in a pool of worker processes.
+PDF_RENDER_MODE = os.getenv("PDF_RENDER_MODE", "thread").lower()
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+PDF_RENDER_START_METHOD = os.getenv("PDF_RENDER_START_METHOD", "spawn")
+
+# "adaptive" sends only structured pages through to_markdown and extracts
+# the rest as plain text; "markdown" renders every page with to_markdown.
+PARSE_TIER_MODE = os.getenv("PARSE_TIER_MODE", "adaptive").lower()
+# Pages with less text than this are treated as blank.
+PARSE_MIN_CHARS = int(os.getenv("PARSE_MIN_CHARS", "40"))
+# Vector paths above this usually mean tables, rules or diagrams.
+PARSE_MAX_DRAWINGS = int(os.getenv("PARSE_MAX_DRAWINGS", "8"))
+# Distinct fonts (bold, italic, monospace...) above this suggest formatting.
+PARSE_MAX_FONTS = int(os.getenv("PARSE_MAX_FONTS", "3"))
+# Many short text blocks (forms, tables, multi-column layouts).
+PARSE_MAX_BLOCKS = int(os.getenv("PARSE_MAX_BLOCKS", "12"))
+PARSE_MIN_CHARS_PER_BLOCK = int(os.getenv("PARSE_MIN_CHARS_PER_BLOCK", "60"))
+
+# Seconds a page may spend in to_markdown before it is extracted as plain
+# text instead; 0 disables the budget.
+PAGE_RENDER_TIMEOUT = float(os.getenv("PAGE_RENDER_TIMEOUT", "30"))
+# Timed-out renders still running in the background (thread rendering only);
+# at the limit, structured pages go straight to plain text until one ends.
+PAGE_RENDER_MAX_ABANDONED = int(os.getenv("PAGE_RENDER_MAX_ABANDONED", "4"))
+# Seconds an idle render helper keeps its copy of the document open.
+PAGE_RENDER_HELPER_IDLE = float(os.getenv("PAGE_RENDER_HELPER_IDLE", "30"))
+
+TIER_TEXT = "text"
+TIER_MARKDOWN = "markdown"
+# Markdown render abandoned after PAGE_RENDER_TIMEOUT, page extracted as text.
+TIER_TIMEOUT = "timeout"
+
+
+class PageRenderTimeout(Exception):
+    pass
+
+
+def _raise_render_timeout(signum, frame):
+    raise PageRenderTimeout()
+
+
+_abandoned_lock = threading.Lock()
+_abandoned_renders = 0
+
+# Idle render helpers by document file, each holding that file open.
+_helpers_lock = threading.Lock()
+_idle_helpers: Dict[Tuple, List["_RenderHelper"]] = {}
+
+
+class _RenderHelper:
+    """
+    Thread with its own open copy of one document file that runs renders on it.
+
+    Between renders the helper sits in ``_idle_helpers`` and keeps its copy
+    open, so consecutive renders reuse it. A helper whose render was abandoned
+    exits once that render ends and is never handed out again. Helpers left
+    idle for PAGE_RENDER_HELPER_IDLE seconds close their copy and exit.
+    """
+
+    def __init__(self, key: Tuple):
+        self.key = key
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="page-render", daemon=True)
+        self.thread.start()
+
+    def _retire(self) -> bool:
+        with _helpers_lock:
+            idle = _idle_helpers.get(self.key, [])
+            if self not in idle:
+                # Checked out just now; a job is on its way.
+                return False
+            idle.remove(self)
+            if not idle:
+                _idle_helpers.pop(self.key, None)
+            return True
+
+    def _run(self):
+        global _abandoned_renders
+        own_doc = None
+        try:
+            while True:
+                try:
+                    job = self.jobs.get(timeout=PAGE_RENDER_HELPER_IDLE)
+                except queue.Empty:
+                    if self._retire():
+                        return
+                    continue
+                try:
+                    if own_doc is None:
+                        own_doc = pymupdf.open(self.key[0])
+                    job["value"] = job["render"](own_doc)
+                except BaseException as e:
+                    job["error"] = e
+                with _abandoned_lock:
+                    job["done"] = True
+                    abandoned = job["abandoned"]
+                    if abandoned:
+                        _abandoned_renders -= 1
+                job["finished"].set()
+                if abandoned:
+                    return
+        finally:
+            if own_doc is not None:
+                own_doc.close()
+
+
+def _helper_key(path: str) -> Tuple:
+    # The upload path is reused when a file is uploaded again, so the key
+    # also pins the file's identity to keep a helper off a replaced file.
+    st = os.stat(path)
+    return (path, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _checkout_helper(key: Tuple) -> _RenderHelper:
+    with _helpers_lock:
+        idle = _idle_helpers.get(key)
+        if idle:
+            helper = idle.pop()
+            if not idle:
+                _idle_helpers.pop(key, None)
+            return helper
+    return _RenderHelper(key)
+
+
+def _checkin_helper(helper: _RenderHelper):
+    with _helpers_lock:
+        _idle_helpers.setdefault(helper.key, []).append(helper)
+
+
+def run_with_timeout(
+    render: Callable[[pymupdf.Document], Any], doc: pymupdf.Document, timeout: float
+) -> Any:
+    """
+    Call ``render(doc)`` and raise ``PageRenderTimeout`` if it runs past ``timeout``.
+
+    In a process's main thread (render pool workers) the call is interrupted
+    with SIGALRM. Elsewhere it runs on a render helper thread with its own
+    open copy of the document file, reused across renders, so a render
+    abandoned on timeout never touches ``doc`` while other pages are read
+    from it; only then is a fresh copy opened for the next render. At most
+    PAGE_RENDER_MAX_ABANDONED abandoned renders run at once; past that, this
+    raises right away. A document opened from memory has no file to copy and
+    is rendered in place without a budget.
+    """
+    global _abandoned_renders
+    if timeout <= 0:
+        return render(doc)
+
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer"):
+        previous = signal.signal(signal.SIGALRM, _raise_render_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return render(doc)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    if not doc.name:
+        return render(doc)
+
+    with _abandoned_lock:
+        if _abandoned_renders >= PAGE_RENDER_MAX_ABANDONED:
+            raise PageRenderTimeout()
+
+    helper = _checkout_helper(_helper_key(doc.name))
+    job = {"render": render, "done": False, "abandoned": False, "finished": threading.Event()}
+    helper.jobs.put(job)
+    job["finished"].wait(timeout)
+    with _abandoned_lock:
+        if not job["done"]:
+            job["abandoned"] = True
+            _abandoned_renders += 1
+            raise PageRenderTimeout()
+    _checkin_helper(helper)
+    if "error" in job:
+        raise job["error"]
+    return job["value"]
+
+
+# Opened once per worker process by the pool initializer.
+_worker_doc: Optional[pymupdf.Document] = None
+
+
+def classify_page(
+    page: pymupdf.Page, hdr_info: IdentifyHeaders, blocks: Optional[List[dict]] = None
+) -> str:
+    """
+    Pick the parse tier for a page: ``markdown`` when headers, tables,
+    drawings or mixed fonts make structure worth keeping, ``text`` for
+    plain prose and nearly blank pages.
+    """
+    if PARSE_TIER_MODE != "adaptive":
+        return TIER_MARKDOWN
+
+    if blocks is None:
+        blocks = page_text_blocks(page)
+    header_sizes = getattr(hdr_info, "header_id", {})
+    chars = 0
+    text_blocks = 0
+    for block in blocks:
+        if not block.get("lines"):
+            continue
+        text_blocks += 1
+        for line in block["lines"]:
+            for span in line["spans"]:
+                text = span["text"].strip()
+                if not text:
+                    continue
+                chars += len(text)
+                if round(span["size"]) in header_sizes:
+                    return TIER_MARKDOWN
+
+    if chars < PARSE_MIN_CHARS:
+        return TIER_TEXT
+    if (
+        text_blocks > PARSE_MAX_BLOCKS
+        and chars / text_blocks < PARSE_MIN_CHARS_PER_BLOCK
+    ):
+        return TIER_MARKDOWN
+    if len(page.get_fonts()) > PARSE_MAX_FONTS:
+        return TIER_MARKDOWN
+    if len(page.get_cdrawings()) > PARSE_MAX_DRAWINGS:
+        return TIER_MARKDOWN
+    return TIER_TEXT
+
+
+def render_page(
+    doc: pymupdf.Document, page_number: int, hdr_info: IdentifyHeaders
+) -> Tuple[str, str, Dict[int, int]]:
+    """
+    Render a single page and return ``(text, tier, fontsizes)``; the page's
+    font-size statistics refine the document's header levels.
+
+    Simple pages are extracted as plain text; structured pages are rendered
+    to markdown, falling back to plain text on errors or when the render runs
+    past PAGE_RENDER_TIMEOUT. Markdown for pages whose content
+    and header levels were rendered before is served from the page cache.
+    """
+    page = doc[page_number]
+    blocks = page_text_blocks(page)
+    fontsizes = font_stats_from_blocks(blocks)
+    if classify_page(page, hdr_info, blocks) == TIER_TEXT:
+        return page.get_text("text"), TIER_TEXT, fontsizes
+
+    cache_key = markdown_cache_key(page, hdr_info)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached, TIER_MARKDOWN, fontsizes
+
+    started = time.perf_counter()
+    try:
+        text = run_with_timeout(
+            lambda render_doc: to_markdown(
+                render_doc,
+                pages=[page_number],
+                hdr_info=hdr_info,
+                write_images=False,
+                show_progress=False,
+            ),
+            doc,
+            PAGE_RENDER_TIMEOUT,
+        )
+    except PageRenderTimeout:
+        print(
+            f"[Slow Page] Page {page_number + 1} exceeded {PAGE_RENDER_TIMEOUT:.0f}s "
+            f"in to_markdown ({time.perf_counter() - started:.1f}s), using plain text"
+        )
+        text = page.get_text("text") or "[Page content could not be read]"
+        return text, TIER_TIMEOUT, fontsizes
+    except Exception:
+        text = page.get_text("text") or "[Page content could not be read]"
+        return text, TIER_TEXT, fontsizes
+
+    cache_set(cache_key, text)
+    return text, TIER_MARKDOWN, fontsizes
+
+
+def _init_render_worker(file_path: str):
+    global _worker_doc
+    _worker_doc = pymupdf.open(file_path)
+
+
+def render_page_range(
+    start: int,
+    stop: int,
+    hdr_info: IdentifyHeaders,
+    chat_id: Optional[str] = None,
+) -> List[Tuple[int, str, str, Dict[int, int]]]:
+    """
+    Render pages ``start``..``stop`` (exclusive) with the worker's open document.
+
+    Returns compact ``(page_number, text, tier, fontsizes)`` tuples; the parent
+    process builds the LangChain documents and their metadata.
+    """
+    results = []
+    for page_number in range(start, stop):
+        if chat_id and get_stop_flag(chat_id):
+            break
+        try:
+            results.append((page_number, *render_page(_worker_doc, page_number, hdr_info)))
+        except Exception as e:
+            print(f"[Error] Failed processing page {page_number}: {e}")
+    return results
+
+
+def create_render_pool(
+    file_path: Union[str, Path], max_workers: Optional[int] = None
+) -> Optional[ProcessPoolExecutor]:
+    """
+    Start a process pool whose workers each open ``file_path`` once.
+
+    Returns None when a pool cannot be started (for example from a daemonic
+    worker process) so callers can fall back to thread rendering.
+    """
+    pool = None
+    try:
+        pool = ProcessPoolExecutor(
+            max_workers=max_workers or PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context(PDF_RENDER_START_METHOD),
+            initializer=_init_render_worker,
+            initargs=(str(file_path),),
+        )
+        # Workers are started lazily; submit a no-op so start-up errors surface here.
+        pool.submit(int).result()
+        return pool
+    except Exception as e:
+        print(f"[Render Pool] Falling back to thread rendering: {e}")
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return None
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from langchain_core.documents import Document
+
+from app.tasks.load_data.batch_format import PageBatch, decode_batch, encode_documents
+
+# Parsed page batches are written here and only a small reference travels
+# through the broker, so this must be storage every indexing worker can read
+# (a volume shared by the workers). Unset keeps sending documents inline.
+PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR", "")
+# Segments older than this are removed on the next write.
+PAGE_STORE_TTL = int(os.getenv("PAGE_STORE_TTL", str(6 * 3600)))
+PAGE_STORE_SWEEP_INTERVAL = 600
+
+_segment_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _segment_path(collection_name: str, file_hash: str) -> Path:
+    # One append-only segment per parsing process, so offsets never race.
+    return Path(collection_name) / f"{(file_hash or 'nohash')[:16]}-{os.getpid()}.pages"
+
+
+def sweep_page_store(max_age: int = PAGE_STORE_TTL):
+    """Delete segments whose last write is older than ``max_age`` seconds."""
+    root = Path(PAGE_STORE_DIR)
+    if not root.exists():
+        return
+    cutoff = time.time() - max_age
+    for segment in root.glob("*/*.pages"):
+        try:
+            if segment.stat().st_mtime < cutoff:
+                segment.unlink()
+        except OSError as e:
+            print(f"[Page Store] Failed to sweep {segment}: {e}")
+
+
+def put_page_batch(
+    documents: List[Document], collection_name: str, start_page: int, end_page: int
+) -> Dict[str, Any]:
+    """
+    Append a parsed batch to the page store and return its claim-check
+    reference (collection, page range, segment, byte offset and length).
+    """
+    global _last_sweep
+
+    file_hash = documents[0].metadata.get("file_hash", "") if documents else ""
+    relative_path = _segment_path(collection_name, file_hash)
+    path = Path(PAGE_STORE_DIR) / relative_path
+    payload = encode_documents(documents)
+
+    with _segment_lock:
+        if time.time() - _last_sweep > PAGE_STORE_SWEEP_INTERVAL:
+            _last_sweep = time.time()
+            sweep_page_store()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as segment:
+            segment.seek(0, os.SEEK_END)
+            offset = segment.tell()
+            segment.write(payload)
+
+    return {
+        "store": "page_store",
+        "collection": collection_name,
+        "start_page": start_page,
+        "end_page": end_page,
+        "pages": len(documents),
+        "path": str(relative_path),
+        "offset": offset,
+        "length": len(payload),
+    }
+
+
+def is_page_batch_ref(obj) -> bool:
+    return isinstance(obj, dict) and obj.get("store") == "page_store"
+
+
+def load_page_batch(ref: Dict[str, Any]) -> PageBatch:
+    """Read and decode the batch a claim-check reference points to."""
+    with open(Path(PAGE_STORE_DIR) / ref["path"], "rb") as segment:
+        segment.seek(ref["offset"])
+        payload = segment.read(ref["length"])
+    if len(payload) != ref["length"]:
+        raise IOError(f"Page batch truncated in {ref['path']} at offset {ref['offset']}")
+    return decode_batch(payload)
+
+
+def resolve_page_batch(payload) -> Union[PageBatch, List[Document]]:
+    """
+    Pages an indexing task was sent: a claim-check reference, an encoded
+    batch, or (from older producers) a list of documents.
+    """
+    if is_page_batch_ref(payload):
+        return load_page_batch(payload)
+    if isinstance(payload, (bytes, bytearray)):
+        return decode_batch(bytes(payload))
+    return payload
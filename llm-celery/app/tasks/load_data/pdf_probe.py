@@ -0,0 +1,109 @@
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pymupdf
+
+from app.tasks.load_data.page_cache import HeaderStats, build_header_stats
+
+
+class DocumentProfile:
+    """
+    What the pipeline needs to know about an upload, captured by a single
+    open in ``probe_pdf`` and reused instead of re-opening the file.
+    """
+
+    __slots__ = (
+        "file_path",
+        "file_hash",
+        "valid",
+        "error",
+        "page_count",
+        "metadata",
+        "is_encrypted",
+        "page_sizes",
+        "text_layer_ratio",
+        "header_stats",
+    )
+
+    def __init__(self, file_path: Union[str, Path], file_hash: Optional[str] = None):
+        self.file_path = str(file_path)
+        self.file_hash = file_hash
+        self.valid = False
+        self.error: Optional[str] = None
+        self.page_count = 0
+        self.metadata: Dict[str, Any] = {}
+        self.is_encrypted = False
+        # Distinct (width, height) in points with the number of pages of that size.
+        self.page_sizes: List[Tuple[Tuple[float, float], int]] = []
+        # Share of the header-sample pages that have extractable text.
+        self.text_layer_ratio = 0.0
+        self.header_stats: Optional[HeaderStats] = None
+
+    @property
+    def has_text_layer(self) -> bool:
+        return self.text_layer_ratio > 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "valid": self.valid,
+            "error": self.error,
+            "page_count": self.page_count,
+            "is_encrypted": self.is_encrypted,
+            "page_sizes": [list(size) + [count] for size, count in self.page_sizes],
+            "text_layer_ratio": round(self.text_layer_ratio, 3),
+        }
+
+
+def _page_size(doc: pymupdf.Document, page_number: int) -> Tuple[float, float]:
+    try:
+        rect = doc.page_cropbox(page_number)
+    except AttributeError:
+        rect = doc[page_number].rect
+    return round(rect.width, 1), round(rect.height, 1)
+
+
+def probe_pdf(
+    file_path: Union[str, Path], file_hash: Optional[str] = None
+) -> DocumentProfile:
+    """
+    Open ``file_path`` once, validate it and build its ``DocumentProfile``:
+    page count, metadata, encryption, page sizes, text-layer presence and
+    the header statistics the renderer starts from.
+    """
+    profile = DocumentProfile(file_path, file_hash)
+    try:
+        with pymupdf.open(file_path) as doc:
+            profile.is_encrypted = bool(doc.is_encrypted or doc.needs_pass)
+            if doc.needs_pass and not doc.authenticate(""):
+                profile.error = "PDF is password protected."
+                return profile
+            if not doc.is_pdf:
+                profile.error = "File is not a PDF."
+                return profile
+
+            profile.page_count = doc.page_count
+            if not profile.page_count:
+                profile.error = "PDF has no pages."
+                return profile
+
+            profile.metadata = doc.metadata or {}
+            profile.page_sizes = sorted(
+                Counter(_page_size(doc, i) for i in range(doc.page_count)).items(),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+            profile.header_stats = build_header_stats(doc, file_hash)
+            sampled = profile.header_stats.pages
+            if sampled:
+                profile.text_layer_ratio = sum(1 for s in sampled.values() if s) / len(
+                    sampled
+                )
+            elif profile.header_stats.complete:
+                # Header totals came from the cache: the text layer was seen before.
+                profile.text_layer_ratio = 1.0 if profile.header_stats.levels().fontsizes else 0.0
+            profile.valid = True
+    except Exception as e:
+        print(f"[PDF Probe] Invalid PDF {file_path}: {e}")
+        profile.error = str(e)
+    return profile
@@ -62,7 +62,9 @@ pip install eventlet
 pip install pdfminer.six
 
 echo "Starting Celery worker..."
-exec celery -A app.config.celery_app.celery_app worker -B --loglevel=info --concurrency=2 -P prefork
+# Parse tasks use the default "celery" queue, index batches PIPELINE_INDEX_QUEUE.
+# Run a dedicated indexing worker with CELERY_QUEUES=indexing to keep them apart.
+exec celery -A app.config.celery_app.celery_app worker -B --loglevel=info --concurrency=2 -P prefork -Q "${CELERY_QUEUES:-celery,indexing}"
 # exec celery -A app.config.celery_app.celery_app worker -Q async-tasks --loglevel=info  --concurrency=100 -P eventlet
 
 
@@ -0,0 +1,37 @@
+"""
+The estimated header levels must match what pymupdf4llm's own
+``IdentifyHeaders`` finds for the same document.
+"""
+import os
+
+import pytest
+
+os.environ["PAGE_CACHE_DIR"] = ""
+
+pymupdf = pytest.importorskip("pymupdf")
+pymupdf4llm = pytest.importorskip("pymupdf4llm")
+
+from app.tasks.load_data.page_cache import build_header_stats  # noqa: E402
+
+
+def _small_body_pdf():
+    """Two pages of 10pt body text under 11pt and 14pt headings."""
+    doc = pymupdf.open()
+    for page_number in range(2):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Chapter {page_number + 1}", fontsize=14)
+        page.insert_text((72, 90), "Section heading", fontsize=11)
+        for line in range(20):
+            page.insert_text(
+                (72, 120 + line * 14),
+                "Body text set in a small font, as in many reports.",
+                fontsize=10,
+            )
+    return doc
+
+
+def test_estimated_levels_match_identify_headers():
+    doc = _small_body_pdf()
+    expected = pymupdf4llm.IdentifyHeaders(doc).header_id
+    assert expected, "fixture should have headers"
+    assert build_header_stats(doc).levels().header_id == expected
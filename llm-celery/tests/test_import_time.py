@@ -0,0 +1,50 @@
+"""
+Importing the ingest tasks must stay cheap: the embedding model and the
+heavy client libraries are loaded lazily per worker process (clients.py).
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+CELERY_ROOT = Path(__file__).resolve().parents[1]
+MODULE = "app.tasks.load_data.load_pdf_data_with_pdf_reader"
+# Seconds a fresh interpreter may spend importing MODULE.
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET", "10"))
+LAZY_MODULES = ["gpt4all", "llama_index", "llama_parse", "chromadb"]
+
+PROBE = f"""
+import importlib, json, sys, time
+started = time.perf_counter()
+importlib.import_module({MODULE!r})
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "loaded": sorted(
+        name for name in {LAZY_MODULES!r}
+        if any(m == name or m.startswith(name + ".") for m in sys.modules)
+    ),
+}}))
+"""
+
+
+def _import_in_subprocess():
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=CELERY_ROOT,
+        env={**os.environ, "CELERY_WARMUP": "0"},
+        capture_output=True,
+        text=True,
+        timeout=IMPORT_BUDGET * 6,
+    )
+    assert completed.returncode == 0, completed.stderr
+    # Module-level prints come first; the probe's report is the last line.
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_import_is_fast_and_lazy():
+    report = _import_in_subprocess()
+    assert report["loaded"] == [], f"imported at module load: {report['loaded']}"
+    assert report["seconds"] < IMPORT_BUDGET, (
+        f"importing {MODULE} took {report['seconds']:.1f}s (budget {IMPORT_BUDGET:.0f}s)"
+    )